@@ -0,0 +1,15 @@
+"""Performance benchmarks for the ppts app.
+
+These aren't tests: they print timings. Run them from the repository root,
+e.g. `python -m benchmarks.transform data/<the ppts file>`.
+"""
+import os
+
+
+def setup():
+    """Configures Django the same way manage.py does."""
+    configuration = os.getenv('ENVIRONMENT', 'development').title()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'planningportal.settings')
+    os.environ.setdefault('DJANGO_CONFIGURATION', configuration)
+    import configurations
+    configurations.setup()
@@ -0,0 +1,102 @@
+"""Load time and query count of the admin's pages on a big dataset.
+
+Fills a throwaway test database (test_<your database>) with --records
+records (see benchmarks.dataset), then fetches each model's changelist,
+a filtered and a searched Record list, and a change form of each model,
+through the test client as a superuser.
+
+Usage: python -m benchmarks.admin [--records 1000000]
+"""
+import argparse
+import time
+
+from benchmarks import setup
+
+REPEAT = 5
+
+
+def pages():
+    from django.urls import reverse
+    from ppts.models import Record
+
+    middle = Record.objects.order_by('id').values_list('id', flat=True)[
+        Record.objects.count() // 2]
+    record = Record.objects.get(id=middle)
+    feature = record.projectfeature_set.first() or Record.objects.filter(
+        projectfeature__isnull=False).first().projectfeature_set.first()
+    changelists = [
+        (name, reverse('admin:ppts_%s_changelist' % name), {})
+        for name in ('record', 'location', 'landuse', 'projectfeature',
+                     'dwellingtype', 'planner')]
+    return changelists + [
+        ('record, status', reverse('admin:ppts_record_changelist'),
+         {'status': 'Disapproved'}),
+        ('record, type and year', reverse('admin:ppts_record_changelist'),
+         {'record_type__category__exact': 'PRJ',
+          'date_opened__gte': '2015-01-01',
+          'date_opened__lt': '2016-01-01'}),
+        ('record, search', reverse('admin:ppts_record_changelist'),
+         {'q': 'garage rear'}),
+        ('record, record id', reverse('admin:ppts_record_changelist'),
+         {'q': record.record_id}),
+        ('location, address', reverse('admin:ppts_location_changelist'),
+         {'q': '1234 Main'}),
+        ('record form', reverse('admin:ppts_record_change',
+                                args=[record.id]), {}),
+        ('location form', reverse('admin:ppts_location_change',
+                                  args=[record.location_id]), {}),
+        ('feature form', reverse('admin:ppts_projectfeature_change',
+                                 args=[feature.id]), {}),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=1000000)
+    args = parser.parse_args()
+    setup()
+
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from django.test.utils import override_settings
+    from benchmarks import dataset
+
+    name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    print('%s database %s' % (connection.vendor, name))
+    # the admin's css isn't collected
+    settings = override_settings(
+        ALLOWED_HOSTS=['testserver'],
+        STATICFILES_STORAGE=
+            'django.contrib.staticfiles.storage.StaticFilesStorage')
+    settings.enable()
+    try:
+        start = time.perf_counter()
+        dataset.fill(args.records)
+        print('%d records written in %.1f s' % (
+            args.records, time.perf_counter() - start))
+        client = Client()
+        client.force_login(get_user_model().objects.create_superuser(
+            'benchmark', '', 'benchmark'))
+        for (label, url, params) in pages():
+            response = client.get(url, params)
+            assert response.status_code == 200, (label, response.status_code)
+            times = []
+            for i in range(REPEAT):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    client.get(url, params)
+                    times.append((time.perf_counter() - start) * 1e3)
+            slowest = max(queries.captured_queries,
+                          key=lambda query: float(query['time']))
+            print('%-24s %8.1f ms %3d queries, slowest %6.1f ms: %s' % (
+                label, min(times), len(queries), float(slowest['time']) * 1e3,
+                slowest['sql'][:60]))
+    finally:
+        settings.disable()
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
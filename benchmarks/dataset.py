@@ -0,0 +1,135 @@
+"""A synthetic PPTS-shaped dataset, written straight to the database.
+
+The proportions roughly follow the real export: a record type and status
+mix where a few values cover most records, 20 years of opening dates, a
+parcel for most records, and child rows (land uses, project features,
+dwelling types, project descriptions) mostly on the PRJ records. It's
+deterministic for a given size and seed.
+
+The record types, statuses and words come from ppts.synthetic's
+Generator, which writes the same kind of data as a CSV export instead, for
+loadppts to read.
+
+    from benchmarks import dataset
+    dataset.fill(100000)
+"""
+import datetime
+
+
+def rows(records, seed=1):
+    """The dataset as {model: (fields, rows)}, rows in ppts.writers form."""
+    from ppts import synthetic
+    from ppts import transform
+    from ppts.models import DwellingType
+    from ppts.models import LandUse
+    from ppts.models import Location
+    from ppts.models import Planner
+    from ppts.models import ProjectDescription
+    from ppts.models import ProjectFeature
+    from ppts.models import Record
+    from ppts.models import RecordType
+
+    generator = synthetic.Generator(seed)
+    rand = generator.rand
+    land_uses = transform.choices(LandUse)
+    features = transform.choices(ProjectFeature)
+    dwellings = transform.choices(DwellingType)
+    descriptions = transform.choices(ProjectDescription)
+
+    data = {model: [] for model in (
+        RecordType, Planner, Location, Record, LandUse, ProjectFeature,
+        DwellingType, Record.project_description.through)}
+    for (category, name, share) in synthetic.RECORD_TYPES:
+        data[RecordType].append(
+            (category, name, 'Subtype', 'Type', 'Group', 'Planning'))
+    for pk in range(1, synthetic.PLANNERS + 1):
+        data[Planner].append((pk, 'P%04d' % pk, 'Planner %d' % pk,
+                              'planner%d@sfgov.org' % pk, '415-555-0100'))
+    for pk in range(1, records + 1):
+        (category, name) = generator.record_type()
+        opened = None
+        if rand.random() < 0.9:
+            opened = synthetic.FIRST_DAY + datetime.timedelta(
+                rand.randrange(synthetic.DAYS))
+        state = generator.status()
+        closed = None
+        if opened is not None and state.startswith('Closed'):
+            closed = opened + datetime.timedelta(rand.randrange(900))
+        location = None
+        if rand.random() < 0.9:
+            location = pk
+            lon = rand.uniform(-122.51, -122.36)
+            lat = rand.uniform(37.71, 37.81)
+            data[Location].append((
+                pk, 'MULTIPOLYGON (((%f %f, %f %f, %f %f, %f %f)))' % (
+                    lon, lat, lon + 0.0002, lat, lon, lat + 0.0002, lon, lat),
+                0.0008, 0.00000004, '%d Main St' % pk,
+                lon, lat, lon + 0.0002, lat + 0.0002, lon + 0.0001,
+                lat + 0.0001))
+        year = opened.year if opened else 2000
+        data[Record].append((
+            pk, rand.randint(1, synthetic.PLANNERS), location, category,
+            '%d-%06d%s' % (year, pk, category), pk, 'TPL%d' % pk,
+            generator.text(2, 5), generator.text(5, 30), state,
+            rand.choice((None, rand.uniform(1e3, 5e7))), '', '', '',
+            opened, closed, None, None, None, None, None, None, None, None,
+            '%032x' % rand.getrandbits(128)))
+        # children, mostly on projects
+        if category != 'PRJ' and rand.random() > 0.05:
+            continue
+        for type in rand.sample(land_uses, rand.randint(1, 3)):
+            exist = rand.randint(0, 20000)
+            proposed = rand.randint(0, 40000)
+            data[LandUse].append((pk, type, exist, proposed, proposed - exist))
+        for type in rand.sample(features, rand.randint(1, 4)):
+            exist = rand.randint(0, 20)
+            proposed = rand.randint(0, 200)
+            data[ProjectFeature].append(
+                (pk, type, '', exist, proposed, proposed - exist))
+        for type in rand.sample(dwellings, rand.randint(0, 2)):
+            proposed = rand.randint(1, 100)
+            data[DwellingType].append(
+                (pk, type, 0, proposed, proposed, proposed * 700))
+        for type in rand.sample(descriptions, rand.randint(1, 3)):
+            data[Record.project_description.through].append((pk, type))
+
+    fields = {
+        RecordType: transform.RECORD_TYPE_FIELDS,
+        Planner: transform.PLANNER_FIELDS,
+        Location: transform.LOCATION_FIELDS,
+        Record: transform.RECORD_FIELDS,
+        LandUse: transform.LAND_USE_FIELDS,
+        ProjectFeature: transform.PROJECT_FEATURE_FIELDS,
+        DwellingType: transform.DWELLING_TYPE_FIELDS,
+        Record.project_description.through:
+            transform.PROJECT_DESCRIPTION_FIELDS,
+    }
+    return {model: (fields[model], data[model]) for model in data}
+
+
+def fill(records, seed=1):
+    """Writes the dataset into the (empty) database, plus a DataImport,
+    the rollup tables and, on PostgreSQL, fresh planner statistics."""
+    from django.db import connection
+    from django.db import transaction
+    from django.utils import timezone
+    from ppts import search
+    from ppts import summaries
+    from ppts import writers
+    from ppts.models import DataImport
+    from ppts.models import ProjectDescription
+
+    writer = writers.get_writer(connection)
+    with transaction.atomic():
+        ProjectDescription.objects.bulk_create(
+            ProjectDescription(type=type)
+            for (type, label) in ProjectDescription.CHOICES)
+        for (model, (fields, data)) in rows(records, seed).items():
+            writer.write(model, fields, data)
+        summaries.rebuild()
+        DataImport.objects.create(
+            filename='synthetic', rows=records, finished=timezone.now())
+    search.optimize(connection)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
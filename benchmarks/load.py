@@ -0,0 +1,78 @@
+"""Throughput and peak memory of loadppts as the export grows.
+
+For each size (1,000, 100,000 and 1,000,000 rows unless given) writes a
+synthetic export (see ppts.synthetic) to --directory, where it's kept for
+the next run, and loads it with loadppts into a throwaway test database
+(test_<your database>). Each size runs in a process of its own, so its
+peak memory is its own. loadppts' --report of each load is saved next to
+the exports as load-<rows>.json, with the time of every stage.
+
+Usage: python -m benchmarks.load [--sizes 1000 100000 1000000]
+           [--workers N] [--directory /tmp/ppts-synthetic]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import setup
+
+SIZES = [1000, 100000, 1000000]
+
+
+def load(args, rows):
+    """Loads rows rows into a fresh test database, returns the report."""
+    from django.core.management import call_command
+    from django.db import connection
+    from ppts import synthetic
+
+    path = synthetic.export(args.directory, rows, args.seed)
+    report = os.path.join(args.directory, 'load-%d.json' % rows)
+    name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        call_command('loadppts', path, workers=args.workers, report=report,
+                     stdout=io.StringIO())
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+    with open(report) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--directory', default=os.path.join(
+        tempfile.gettempdir(), 'ppts-synthetic'))
+    # runs one size, in the process main() starts for it
+    parser.add_argument('--child', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    os.makedirs(args.directory, exist_ok=True)
+
+    if not args.child:
+        print('%10s %9s %9s %10s %9s %9s' % (
+            'rows', 'wall s', 'cpu s', 'rows/s', 'peak MB', 'worker MB'),
+            flush=True)
+        for rows in args.sizes:
+            subprocess.run(
+                [sys.executable, '-m', 'benchmarks.load', '--child',
+                 '--sizes', str(rows), '--workers', str(args.workers),
+                 '--seed', str(args.seed), '--directory', args.directory],
+                check=True)
+        return
+    setup()
+    rows = args.sizes[0]
+    report = load(args, rows)
+    print('%10d %9.1f %9.1f %10.0f %9.0f %9.0f' % (
+        rows, report['wall_seconds'], report['cpu_seconds'],
+        report['rows_per_second'], report['peak_rss_mb'],
+        report['worker_peak_rss_mb']), flush=True)
+
+
+if __name__ == '__main__':
+    main()
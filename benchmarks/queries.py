@@ -0,0 +1,161 @@
+"""Latency and query plans of the queries the site runs, on synthetic data.
+
+Fills a throwaway test database (test_<your database>) with --records
+records (see benchmarks.dataset), then times each query below: the ones
+behind the dashboards and their rollup, the JSON API and exports, the
+admin, and loadppts --incremental. Point DATABASE_URL at the backend to
+measure. The same seed gives the same data, so runs can be compared.
+
+Usage: python -m benchmarks.queries [--records 100000] [--explain]
+           [--only api] [--without-indexes]
+
+--explain prints each query's plan. --without-indexes drops the indexes
+the ppts models declare in their Meta (see ppts/models.py) before timing,
+to see what each one is worth.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks import setup
+
+REPEAT = 15
+
+
+def queries():
+    """(name, queryset) of the representative queries."""
+    import datetime
+    from django.db.models import Count
+    from django.db.models import Sum
+    from django.db.models.functions import ExtractYear
+    from django.http import QueryDict
+    from ppts import api
+    from ppts import exports
+    from ppts import search
+    from ppts.models import DataImport
+    from ppts.models import Location
+    from ppts.models import ProjectFeature
+    from ppts.models import Record
+    from ppts.models import RecordSummary
+    from ppts import summaries
+
+    def page(query, after=None):
+        records = api.filter_records(Record.objects.all(), QueryDict(query))
+        if after is not None:
+            records = records.filter(id__gt=after)
+        return records.order_by('id')[:101]
+
+    middle = Record.objects.count() // 2
+    ids = list(range(middle, middle + exports.BATCH_SIZE))
+    found = Record.objects.filter(pk=middle).values_list(
+        'record_id', flat=True).first()
+    return [
+        # the dashboards, see ppts.views and ppts.summaries
+        ('graph: status counts', RecordSummary.objects.filter(
+            record_type__pk='PRJ').values('status').annotate(
+                count=Count('id'))),
+        ('rollup: records', Record.objects.values(
+            'record_type_id', 'status', year=ExtractYear('date_opened'),
+        ).annotate(records=Count('id')).order_by()),
+        ('rollup: features', ProjectFeature.objects.filter(
+            type__in=summaries.UNITS, record__isnull=False).values(
+                'type', 'record__record_type_id', 'record__status',
+                year=ExtractYear('record__date_opened')).annotate(
+                    net=Sum('net')).order_by()),
+        ('dataset version', DataImport.objects.filter(
+            finished__isnull=False).order_by('-id').values_list(
+                'id', 'finished')[:1]),
+        # the API, see ppts.api
+        ('api: first page', page('')),
+        ('api: deep page', page('', after=middle)),
+        ('api: status', page('status=Approved')),
+        ('api: status, deep', page('status=Approved', after=middle)),
+        ('api: rare status', page('status=Disapproved')),
+        ('api: record type', page('record_type=CUA')),
+        ('api: rare type, deep', page('record_type=SHD', after=middle)),
+        ('api: opened in 2015', page(
+            'opened_after=2015-01-01&opened_before=2015-12-31')),
+        ('api: opened in a week', page(
+            'opened_after=2015-06-01&opened_before=2015-06-07')),
+        ('api: opened, type', page(
+            'opened_after=2015-01-01&record_type=PRJ')),
+        ('api: description', page('project_description=ADU')),
+        ('api: prefetch features', ProjectFeature.objects.filter(
+            record_id__in=ids[:100]).order_by('id')),
+        ('api: search', search.matching(
+            Record.objects.all(), 'garage rear').order_by('id')[:101]),
+        # exports, see ppts.exports
+        ('export: batch units', ProjectFeature.objects.filter(
+            record_id__in=ids, type__in=summaries.UNITS).values_list(
+                'record_id', 'type').annotate(count=Count('id')).order_by()),
+        # the admin's record list
+        ('admin: changelist', Record.objects.order_by('-pk')[:100]),
+        ('admin: record id', Record.objects.filter(record_id=found)),
+        ('admin: closed in 2018', Record.objects.filter(
+            date_closed__gte=datetime.date(2018, 1, 1),
+            date_closed__lt=datetime.date(2019, 1, 1)).order_by('-pk')[:100]),
+        # loadppts --incremental
+        ('incremental: orphans', Location.objects.filter(
+            record__isnull=True).values('id')),
+    ]
+
+
+def timed(queryset):
+    """Median and slowest of REPEAT runs, in ms, and the row count."""
+    count = len(queryset.all())
+    times = []
+    for i in range(REPEAT):
+        start = time.perf_counter()
+        len(queryset.all())
+        times.append((time.perf_counter() - start) * 1e3)
+    return statistics.median(times), max(times), count
+
+
+def drop_indexes(connection):
+    from django.apps import apps
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('ppts').get_models():
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+                print('dropped %s' % index.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--records', type=int, default=100000)
+    parser.add_argument('--explain', action='store_true')
+    parser.add_argument('--only', help='Just the queries named like this')
+    parser.add_argument('--without-indexes', action='store_true')
+    args = parser.parse_args()
+    setup()
+
+    from django.db import connection
+    from benchmarks import dataset
+
+    name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    print('%s database %s' % (connection.vendor, name))
+    try:
+        start = time.perf_counter()
+        dataset.fill(args.records)
+        print('%d records written in %.1f s' % (
+            args.records, time.perf_counter() - start))
+        if args.without_indexes:
+            drop_indexes(connection)
+        for (label, queryset) in queries():
+            if args.only and args.only not in label:
+                continue
+            median, slowest, count = timed(queryset)
+            print('%-26s %6d rows %9.2f ms median %9.2f ms max' % (
+                label, count, median, slowest))
+            if args.explain:
+                for line in queryset.explain().splitlines():
+                    # the export's list of ids goes on for a while
+                    if len(line) > 150:
+                        line = line[:147] + '...'
+                    print('    ' + line)
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
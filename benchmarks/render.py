@@ -0,0 +1,58 @@
+"""Latency and memory of rendering a graph over and over.
+
+Calls a graph function and ppts.rendering.render() directly, as a cache
+miss in graphs_manager does, and prints the time per render and the
+process's resident memory every --every renders. Memory should level off
+after the first few hundred renders.
+
+Usage: python -m benchmarks.render [--graph sample_1] [--renders 10000]
+           [--format png] [--dpi 100]
+
+sample_2 queries the database DATABASE_URL points at.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from benchmarks import setup
+
+
+def rss_mb():
+    """Current resident memory of this process, in MB (Linux only)."""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--graph', default='sample_1')
+    parser.add_argument('--renders', type=int, default=10000)
+    parser.add_argument('--every', type=int, default=1000)
+    parser.add_argument('--format', default='png')
+    parser.add_argument('--dpi', type=int, default=100)
+    args = parser.parse_args()
+    setup()
+
+    from ppts import graphs
+    from ppts import rendering
+    graph = graphs.GRAPHS[args.graph]
+    options = dict(rendering.DEFAULTS, format=args.format, dpi=args.dpi)
+
+    print('%8s %9s %9s %9s' % ('renders', 'mean ms', 'p99 ms', 'RSS MB'))
+    times = []
+    for i in range(1, args.renders + 1):
+        start = time.perf_counter()
+        rendering.render(graph(), **options)
+        times.append(time.perf_counter() - start)
+        if i % args.every == 0:
+            times.sort()
+            print('%8d %9.2f %9.2f %9.1f' % (
+                i, statistics.mean(times) * 1e3,
+                times[int(len(times) * 0.99)] * 1e3, rss_mb()))
+            times = []
+
+
+if __name__ == '__main__':
+    main()
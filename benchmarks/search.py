@@ -0,0 +1,66 @@
+"""Time of ppts.search's full text queries vs icontains on every word.
+
+Loads a PPTS CSV export into a throwaway test database (test_<your
+database>), which is created and dropped again, so point DATABASE_URL at
+the backend to measure. Each search is timed as a count of the matching
+records, and as the top 20 by rank, followed by the query plan of one.
+
+Usage: python -m benchmarks.search /path/to/ppts.csv [--query 'adu garage']
+"""
+import argparse
+import io
+import time
+
+from benchmarks import setup
+
+QUERIES = ['demolition', 'accessory dwelling unit', 'cannabis retail',
+           'new construction housing']
+REPEAT = 20
+
+
+def timed(func):
+    func()
+    start = time.perf_counter()
+    for i in range(REPEAT):
+        result = func()
+    return result, (time.perf_counter() - start) / REPEAT * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('filename')
+    parser.add_argument('--query', action='append')
+    args = parser.parse_args()
+    setup()
+
+    from django.core.management import call_command
+    from django.db import connection
+    from ppts import search
+    from ppts.models import Record
+
+    name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    print('%s database %s' % (connection.vendor, name))
+    try:
+        call_command('loadppts', args.filename, stdout=io.StringIO())
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE ppts_record')
+        print('%d records' % Record.objects.count())
+        records = Record.objects.all()
+        queries = args.query or QUERIES
+        for query in queries:
+            terms = search.words(query)
+            found, index = timed(
+                lambda: search.matching(records, query).count())
+            ranked, top = timed(lambda: search.ranked(query, 20))
+            like, scan = timed(lambda: search.like(records, terms).count())
+            print('%-26s %6d found %8.2f ms  top 20 %8.2f ms  '
+                  'icontains %6d found %8.2f ms' % (
+                      query, found, index, top, like, scan))
+        print(search.matching(records, queries[0]).values('id').explain())
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Load time of a CSV export vs a dumpppts snapshot of the same data.
+
+Runs in a throwaway test database (test_<your database>), which is created
+and dropped again, so point DATABASE_URL at the backend to measure.
+
+Usage: python -m benchmarks.snapshot /path/to/ppts.csv
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from benchmarks import setup
+
+
+def timed(label, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print('%-24s %8.2f s' % (label, time.perf_counter() - start))
+    return result
+
+
+def clear():
+    from django.db import connection
+    from ppts import snapshots
+    with connection.cursor() as cursor:
+        for model in reversed(snapshots.MODELS):
+            cursor.execute('DELETE FROM %s' % connection.ops.quote_name(
+                model._meta.db_table))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('filename')
+    args = parser.parse_args()
+    setup()
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    def load(path):
+        call_command('loadppts', path, stdout=io.StringIO())
+
+    def dump(path, format):
+        call_command('dumpppts', path, format=format, stdout=io.StringIO())
+
+    name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    print('%s database %s' % (connection.vendor, name))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            timed('load csv', load, args.filename)
+            for format in ('parquet', 'arrow'):
+                path = os.path.join(tmp, format)
+                timed('dump %s' % format, dump, path, format)
+            for format in ('parquet', 'arrow'):
+                path = os.path.join(tmp, format)
+                size = sum(os.path.getsize(os.path.join(path, f))
+                           for f in os.listdir(path))
+                clear()
+                timed('load %s (%.0f MB)' % (format, size / 1e6), load, path)
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Time of ppts.spatial's bounding box and radius queries.
+
+Fills a throwaway test database (test_<your database>) with --parcels
+small square parcels scattered over San Francisco, then times a block
+sized bbox and two radius queries, with the query plan of one, and the
+same bbox filter done by parsing every polygon in Python.
+
+Usage: python -m benchmarks.spatial [--parcels 50000]
+"""
+import argparse
+import random
+import time
+
+from benchmarks import setup
+
+# roughly the city, in degrees
+WEST, SOUTH, EAST, NORTH = -122.51, 37.71, -122.36, 37.81
+SIDE = 0.0002
+REPEAT = 20
+
+
+def parcels(count):
+    from ppts import transform
+    from ppts.models import Location
+    random.seed(1)
+    for pk in range(count):
+        x = random.uniform(WEST, EAST)
+        y = random.uniform(SOUTH, NORTH)
+        geom = 'MULTIPOLYGON (((%f %f, %f %f, %f %f, %f %f, %f %f)))' % (
+            x, y, x + SIDE, y, x + SIDE, y + SIDE, x, y + SIDE, x, y)
+        bounds = transform.geometry_bounds(geom)
+        yield Location(
+            id=pk, the_geom=geom, address='', **dict(zip(
+                ('min_lon', 'min_lat', 'max_lon', 'max_lat', 'centroid_lon',
+                 'centroid_lat'), bounds)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--parcels', type=int, default=50000)
+    args = parser.parse_args()
+    setup()
+
+    from django.db import connection
+    from ppts import spatial
+    from ppts import transform
+    from ppts.models import Location
+
+    name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    print('%s database %s' % (connection.vendor, name))
+    try:
+        Location.objects.bulk_create(parcels(args.parcels), batch_size=500)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE ppts_location')
+        locations = Location.objects.all()
+        box = (-122.45, 37.75, -122.444, 37.7545)
+        queries = [
+            ('bbox 500 m', spatial.in_bbox(locations, *box)),
+            ('near 300 m', spatial.near(locations, -122.45, 37.75, 300)),
+            ('near 2 km', spatial.near(locations, -122.45, 37.75, 2000)),
+        ]
+        for (label, query) in queries:
+            ids = query.values_list('id', flat=True)
+            list(ids)
+            start = time.perf_counter()
+            for i in range(REPEAT):
+                found = len(list(ids.all()))
+            print('%-12s %6d parcels %8.2f ms' % (
+                label, found, (time.perf_counter() - start) / REPEAT * 1e3))
+        print(queries[1][1].values('id').explain())
+
+        start = time.perf_counter()
+        found = 0
+        for geom in Location.objects.values_list('the_geom', flat=True):
+            bounds = transform.geometry_bounds(geom)
+            if (bounds[0] <= box[2] and bounds[2] >= box[0] and
+                    bounds[1] <= box[3] and bounds[3] >= box[1]):
+                found += 1
+        print('%-12s %6d parcels %8.2f ms' % (
+            'python scan', found, (time.perf_counter() - start) * 1e3))
+    finally:
+        connection.creation.destroy_test_db(name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
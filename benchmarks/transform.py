@@ -0,0 +1,51 @@
+"""Rows/sec of the loadppts child-table transforms, per-row vs column-wise.
+
+Usage: python -m benchmarks.transform /path/to/ppts.csv [--rows N]
+"""
+import argparse
+import time
+
+from benchmarks import setup
+
+
+def per_row(chunk, pks):
+    from ppts import reference
+    return reference.transform(chunk, pks)
+
+
+def column_wise(chunk, pks):
+    from ppts import transform
+    out = transform.row_hashes(chunk)
+    out.extend(transform.project_descriptions(chunk, pks))
+    out.extend(transform.dwelling_types(chunk, pks))
+    out.extend(transform.project_features(chunk, pks))
+    out.extend(transform.land_uses(chunk, pks))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('filename')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--chunksize', type=int, default=1000)
+    args = parser.parse_args()
+    setup()
+
+    import numpy as np
+    import pandas as pd
+    data = pd.read_csv(args.filename, nrows=args.rows)
+    chunks = [data.iloc[start:start + args.chunksize]
+              for start in range(0, len(data), args.chunksize)]
+
+    print('%d rows in chunks of %d' % (len(data), args.chunksize))
+    for func in (per_row, column_wise):
+        start = time.perf_counter()
+        for chunk in chunks:
+            func(chunk, np.arange(len(chunk)))
+        elapsed = time.perf_counter() - start
+        print('%-12s %8.3f s %12.0f rows/sec' % (
+            func.__name__, elapsed, len(data) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
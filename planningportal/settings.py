@@ -117,6 +117,17 @@ class Common(Configuration):
 
     AUTH_USER_MODEL = 'users.User'
 
+    # Rendered graphs, see ppts/cache.py for the backends
+    PPTS_GRAPH_CACHE = {
+        'BACKEND': 'ppts.cache.MemoryCache',
+        'OPTIONS': {'max_entries': 64},
+    }
+    # How long a process goes before checking for a new import
+    PPTS_DATASET_VERSION_TTL = values.IntegerValue(5)
+    # How long browsers and proxies use a page or graph before asking
+    # whether it changed, see ppts/conditional.py
+    PPTS_HTTP_MAX_AGE = values.IntegerValue(300)
+
 
 class Development(Common):
     """
@@ -1,5 +1,19 @@
+"""The admin, set up for tables with a million rows.
+
+- Changelists show related objects with list_select_related, so a page is
+  one query rather than one per row, and only filter on indexed columns or
+  small tables.
+- Foreign keys to the big tables (Record, Location) are raw id fields
+  rather than a <select> of every row; planners are autocompleted.
+- On PostgreSQL a count of more than 10,000 rows is the planner's
+  estimate rather than a COUNT(*), see EstimatedCountPaginator.
+"""
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
+from ppts.models import DataImport
 from ppts.models import DwellingType
 from ppts.models import LandUse
 from ppts.models import Location
@@ -7,13 +21,129 @@ from ppts.models import Planner
 from ppts.models import ProjectFeature
 from ppts.models import ProjectDescription
 from ppts.models import Record
+from ppts.models import RecordSummary
 from ppts.models import RecordType
+from ppts import search
+
+
+class EstimatedCountPaginator(Paginator):
+    """Counts up to EXACT_UNDER rows, and past that, on PostgreSQL, takes
+    the query planner's estimate rather than a COUNT(*) of them all.
+
+    A changelist of a million rows, or a filter or search that matches a
+    good part of them, is counted in a few milliseconds rather than a
+    second. The estimate is usually within a few percent; the admin shows
+    it as the number of results and pages. Other databases are counted.
+    """
+
+    EXACT_UNDER = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return super().count
+        # a LIMIT stops the count early
+        count = queryset.order_by()[:self.EXACT_UNDER + 1].count()
+        if count <= self.EXACT_UNDER:
+            return count
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        return max(count, int(plan[0]['Plan']['Plan Rows']))
+
+
+class BigTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # "5 results (1,000,000 total)" would count the table after all
+    show_full_result_count = False
+
+
+class StatusFilter(admin.SimpleListFilter):
+    """Record status, with the choices read from the rollup table rather
+    than a DISTINCT over every record. They're as of the last import."""
+    title = 'status'
+    parameter_name = 'status'
+
+    def lookups(self, request, model_admin):
+        statuses = RecordSummary.objects.order_by('status').values_list(
+            'status', flat=True).distinct()
+        return [(status, status) for status in statuses]
+
+    def queryset(self, request, queryset):
+        if self.value() is not None:
+            return queryset.filter(status=self.value())
+        return queryset
+
+
+class RecordAdmin(BigTableAdmin):
+    list_display = ('record_id', 'name', 'status', 'record_type',
+                    'date_opened', 'planner')
+    list_select_related = ('record_type', 'planner')
+    # (status, id), record_type and date_opened are indexed, see the
+    # Record model
+    list_filter = (StatusFilter, 'record_type', 'date_opened')
+    raw_id_fields = ('location', 'parent')
+    autocomplete_fields = ('planner',)
+    # searched with the full text index, see get_search_results
+    search_fields = ('name', 'description')
+
+    def get_search_results(self, request, queryset, search_term):
+        """The record with the search as its record id if there is one,
+        otherwise the records matching every word of it in their name or
+        description (see ppts.search)."""
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        # not one query with an OR, which PostgreSQL can only run as a scan
+        # of the whole table
+        by_record_id = queryset.filter(record_id=search_term)
+        if by_record_id.exists():
+            return by_record_id, False
+        return search.matching(queryset, search_term), False
+
+
+class RecordChildAdmin(BigTableAdmin):
+    list_display = ('record', 'type', 'exist', 'proposed', 'net')
+    list_select_related = ('record',)
+    list_filter = ('type',)
+    raw_id_fields = ('record',)
+
+
+class ProjectFeatureAdmin(RecordChildAdmin):
+    list_display = ('record', 'type', 'other_name', 'exist', 'proposed',
+                    'net')
+
+
+class DwellingTypeAdmin(RecordChildAdmin):
+    list_display = ('record', 'type', 'exist', 'proposed', 'net', 'area')
+
+
+class LocationAdmin(BigTableAdmin):
+    list_display = ('id', 'address', 'centroid_lon', 'centroid_lat')
+    # the start of the address, a LIKE 'x%' rather than '%x%', which
+    # PostgreSQL reads off an index (see migration 0011)
+    search_fields = ('^address',)
+
+
+class PlannerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'email', 'phone', 'planner_id')
+    search_fields = ('name', 'email', 'planner_id')
+
+
+class DataImportAdmin(admin.ModelAdmin):
+    list_display = ('id', 'filename', 'incremental', 'started', 'finished',
+                    'rows')
+
 
-admin.site.register(DwellingType)
-admin.site.register(LandUse)
-admin.site.register(Location)
-admin.site.register(Planner)
-admin.site.register(ProjectFeature)
+admin.site.register(DataImport, DataImportAdmin)
+admin.site.register(DwellingType, DwellingTypeAdmin)
+admin.site.register(LandUse, RecordChildAdmin)
+admin.site.register(Location, LocationAdmin)
+admin.site.register(Planner, PlannerAdmin)
+admin.site.register(ProjectFeature, ProjectFeatureAdmin)
 admin.site.register(ProjectDescription)
-admin.site.register(Record)
-admin.site.register(RecordType)
\ No newline at end of file
+admin.site.register(Record, RecordAdmin)
+admin.site.register(RecordType)
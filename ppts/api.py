@@ -0,0 +1,254 @@
+"""A read-only JSON API for Records.
+
+    /api/records                    a page of records, by id
+    /api/records?after=<id>         the page after the record with that id
+    /api/records/<id>               one record
+    /api/search?q=<words>           the records best matching a search
+
+Pages are keyset paginated: each page is the first `limit` (default 100,
+at most 1000) records with an id above `after`, and `next` is the URL of
+the following page, or null after the last one. Unlike an OFFSET, that's
+an index range scan however deep the page is.
+
+The list can be filtered with:
+
+    status=<status>                 repeat for any of several
+    record_type=<category>          e.g. PRJ, repeat for any of several
+    opened_after=YYYY-MM-DD         date_opened on or after
+    opened_before=YYYY-MM-DD        date_opened on or before
+    closed_after=YYYY-MM-DD
+    closed_before=YYYY-MM-DD
+    project_description=<type>      e.g. NEW_CONSTRUCTION, repeat for all
+                                    of several
+    bbox=<west>,<south>,<east>,<north>
+                                    parcel overlaps the box (degrees)
+    near=<lon>,<lat>,<meters>       parcel's centroid within meters
+    q=<words>                       name or description has every word
+                                    (see ppts.search)
+
+Each record comes with its record type, planner and location, and its
+land uses, project features, dwelling types and project descriptions. A
+page takes the same five queries however many records are on it.
+
+/api/search returns the `limit` (default 20, at most 1000) records that
+best match q, best first, each with its rank. It takes no other filters.
+
+Responses have an ETag and Last-Modified from the dataset version, so
+clients can revalidate them with a conditional GET (see ppts.conditional).
+"""
+import datetime
+import decimal
+import math
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import JsonResponse
+
+from ppts.conditional import conditional
+from ppts.models import DwellingType
+from ppts.models import LandUse
+from ppts.models import Location
+from ppts.models import ProjectFeature
+from ppts.models import Record
+from ppts import search as fulltext
+from ppts import spatial
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+SEARCH_SIZE = 20
+
+RECORD_FIELDS = (
+    'id', 'record_id', 'object_id', 'template_id', 'name', 'description',
+    'status', 'construct_cost', 'related_building_permit', 'acalink',
+    'aalink', 'date_opened', 'date_closed', 'mcd_referral',
+    'environmental_review', 'bos_1st_read', 'bos_2nd_read', 'com_hearing',
+    'mayoral_sign', 'transmit_date_bos', 'com_hearing_date_bos')
+RECORD_TYPE_FIELDS = ('category', 'name', 'subtype', 'type')
+PLANNER_FIELDS = ('planner_id', 'name', 'email', 'phone')
+LOCATION_FIELDS = ('id', 'address', 'shape_length', 'shape_area', 'min_lon',
+                   'min_lat', 'max_lon', 'max_lat', 'centroid_lon',
+                   'centroid_lat')
+LAND_USE_FIELDS = ('type', 'exist', 'proposed', 'net')
+PROJECT_FEATURE_FIELDS = ('type', 'other_name', 'exist', 'proposed', 'net')
+DWELLING_TYPE_FIELDS = ('type', 'exist', 'proposed', 'net', 'area')
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def records_queryset():
+    """Records with everything serialize() needs, in five queries."""
+    return Record.objects.select_related(
+        'record_type', 'planner', 'location',
+    ).prefetch_related(
+        Prefetch('landuse_set', LandUse.objects.order_by('id')),
+        Prefetch('projectfeature_set', ProjectFeature.objects.order_by('id')),
+        Prefetch('dwellingtype_set', DwellingType.objects.order_by('id')),
+        'project_description',
+    )
+
+
+def values(obj, fields):
+    if obj is None:
+        return None
+    result = {}
+    for name in fields:
+        value = getattr(obj, name)
+        # NaN isn't JSON, as a float or a Decimal
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        elif isinstance(value, decimal.Decimal) and value.is_nan():
+            value = None
+        result[name] = value
+    return result
+
+
+def serialize(record):
+    data = values(record, RECORD_FIELDS)
+    data['record_type'] = values(record.record_type, RECORD_TYPE_FIELDS)
+    data['planner'] = values(record.planner, PLANNER_FIELDS)
+    data['location'] = values(record.location, LOCATION_FIELDS)
+    data['land_uses'] = [values(land_use, LAND_USE_FIELDS)
+                         for land_use in record.landuse_set.all()]
+    data['project_features'] = [
+        values(feature, PROJECT_FEATURE_FIELDS)
+        for feature in record.projectfeature_set.all()]
+    data['dwelling_types'] = [
+        values(dwelling_type, DWELLING_TYPE_FIELDS)
+        for dwelling_type in record.dwellingtype_set.all()]
+    data['project_descriptions'] = sorted(
+        description.type
+        for description in record.project_description.all())
+    return data
+
+
+def parse_int(params, name, default, low, high):
+    value = params.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise BadRequest('%s must be a whole number' % name)
+    if not low <= value <= high:
+        raise BadRequest('%s must be between %d and %d' % (name, low, high))
+    return value
+
+
+def parse_date(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise BadRequest('%s must be a date like 2018-12-31' % name)
+
+
+def parse_floats(params, name, count):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        numbers = [float(number) for number in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count or not all(map(math.isfinite, numbers)):
+        raise BadRequest('%s must be %d numbers separated by commas' % (
+            name, count))
+    return numbers
+
+
+def filter_records(records, params):
+    """Applies the filters in the query string params to records."""
+    if 'status' in params:
+        records = records.filter(status__in=params.getlist('status'))
+    if 'record_type' in params:
+        records = records.filter(
+            record_type_id__in=params.getlist('record_type'))
+    for (name, lookup) in (
+            ('opened_after', 'date_opened__gte'),
+            ('opened_before', 'date_opened__lte'),
+            ('closed_after', 'date_closed__gte'),
+            ('closed_before', 'date_closed__lte')):
+        date = parse_date(params, name)
+        if date is not None:
+            records = records.filter(**{lookup: date})
+    for description in params.getlist('project_description'):
+        # a join per description, so a record has to have all of them
+        records = records.filter(project_description=description)
+    bbox = parse_floats(params, 'bbox', 4)
+    if bbox is not None:
+        records = records.filter(
+            location__in=spatial.in_bbox(Location.objects.all(), *bbox))
+    point = parse_floats(params, 'near', 3)
+    if point is not None:
+        records = records.filter(
+            location__in=spatial.near(Location.objects.all(), *point).values(
+                'id'))
+    if 'q' in params:
+        records = fulltext.matching(records, params['q'])
+    return records
+
+
+def error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+@conditional()
+def records(request):
+    """A page of records, see the module docstring."""
+    params = request.GET
+    try:
+        limit = parse_int(params, 'limit', PAGE_SIZE, 1, MAX_PAGE_SIZE)
+        after = parse_int(params, 'after', None, -2**31, 2**31 - 1)
+        page = filter_records(records_queryset(), params)
+    except BadRequest as e:
+        return error(str(e))
+    if after is not None:
+        page = page.filter(id__gt=after)
+    # one more than the page, to know whether there's a next one
+    page = list(page.order_by('id')[:limit + 1])
+    next_url = None
+    if len(page) > limit:
+        page = page[:limit]
+        query = params.copy()
+        query['after'] = page[-1].id
+        next_url = '%s?%s' % (request.path, query.urlencode())
+    return JsonResponse(
+        {'results': [serialize(record) for record in page], 'next': next_url},
+        encoder=DjangoJSONEncoder)
+
+
+@conditional()
+def record(request, pk):
+    """One record by id."""
+    try:
+        found = records_queryset().get(pk=pk)
+    except Record.DoesNotExist:
+        return error('There is no record %d' % pk, status=404)
+    return JsonResponse(serialize(found), encoder=DjangoJSONEncoder)
+
+
+@conditional()
+def search(request):
+    """The records that best match ?q=, see the module docstring."""
+    try:
+        limit = parse_int(request.GET, 'limit', SEARCH_SIZE, 1, MAX_PAGE_SIZE)
+    except BadRequest as e:
+        return error(str(e))
+    query = request.GET.get('q', '')
+    if not fulltext.words(query):
+        return error('q must have a word to search for')
+    ranks = dict(fulltext.ranked(query, limit))
+    found = records_queryset().in_bulk(ranks)
+    results = []
+    for (pk, rank) in ranks.items():
+        if pk not in found:
+            # deleted since
+            continue
+        data = serialize(found[pk])
+        data['rank'] = rank
+        results.append(data)
+    return JsonResponse({'results': results}, encoder=DjangoJSONEncoder)
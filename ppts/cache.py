@@ -0,0 +1,223 @@
+"""Server-side cache of the rendered graphs.
+
+The graphs only change when loadppts imports new data, so a rendered graph
+is stored under its name, its parameters and the dataset version, and
+served from there until the next import changes the version. Old versions
+are never looked up again and fall out of the cache as it evicts its least
+recently used entries.
+
+The backend is set in settings, the same way as Django's CACHES:
+
+    PPTS_GRAPH_CACHE = {
+        'BACKEND': 'ppts.cache.MemoryCache',
+        'OPTIONS': {'max_entries': 64},
+    }
+
+MemoryCache is per process; FileCache is shared by every process on the
+machine (every gunicorn worker); DjangoCache uses one of the CACHES, to
+share graphs between machines with memcached or redis.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from ppts.models import DataImport
+
+
+class MemoryCache:
+    """An LRU cache of at most max_entries, local to the process."""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCache:
+    """An LRU cache of at most max_entries files in directory.
+
+    A file's modification time is when it was last used, so any process
+    can evict the least recently used ones.
+    """
+
+    def __init__(self, directory, max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(
+            key.encode('utf-8')).hexdigest() + '.graph')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value
+
+    def set(self, key, value):
+        # written under another name and renamed, so readers never see
+        # half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.graph'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except OSError:
+                    pass
+        entries.sort()
+        for (mtime, path) in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.graph'):
+                os.remove(entry.path)
+
+
+class DjangoCache:
+    """One of the CACHES from settings, which does its own eviction."""
+
+    def __init__(self, alias='default', prefix='ppts-graph:'):
+        self.cache = caches[alias]
+        self.prefix = prefix
+
+    def key(self, key):
+        # memcached keys can't have spaces or be longer than 250 characters
+        return self.prefix + hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self.cache.get(self.key(key))
+
+    def set(self, key, value):
+        self.cache.set(self.key(key), value, timeout=None)
+
+    def clear(self):
+        self.cache.clear()
+
+
+_dataset = None
+_dataset_expires = 0
+_backend = None
+
+
+def latest_import():
+    """(version, finished) of the latest finished import, see
+    dataset_version(). Looking it up is a query, so it's kept for
+    PPTS_DATASET_VERSION_TTL seconds."""
+    global _dataset, _dataset_expires
+    now = time.monotonic()
+    if _dataset is None or now >= _dataset_expires:
+        latest = DataImport.objects.filter(finished__isnull=False).order_by(
+            '-id').values_list('id', 'finished').first()
+        if latest is None:
+            _dataset = ('0', None)
+        else:
+            _dataset = ('%d.%d' % (latest[0], latest[1].timestamp()),
+                        latest[1])
+        _dataset_expires = now + settings.PPTS_DATASET_VERSION_TTL
+    return _dataset
+
+
+def dataset_version():
+    """A stamp that changes whenever loadppts finishes an import.
+
+    It's the id and finish time of the latest finished DataImport (the time
+    as well, in case the database was recreated and ids start over), or '0'
+    before anything was imported.
+    """
+    return latest_import()[0]
+
+
+def dataset_modified():
+    """When the latest import finished, or None before anything was
+    imported."""
+    return latest_import()[1]
+
+
+def forget_version():
+    """Makes the next dataset_version() look the version up again."""
+    global _dataset
+    _dataset = None
+
+
+def get_backend():
+    """The backend configured in settings.PPTS_GRAPH_CACHE."""
+    global _backend
+    if _backend is None:
+        config = settings.PPTS_GRAPH_CACHE
+        _backend = import_string(config['BACKEND'])(
+            **config.get('OPTIONS', {}))
+    return _backend
+
+
+@receiver(setting_changed)
+def reset(setting, **kwargs):
+    global _backend
+    if setting == 'PPTS_GRAPH_CACHE':
+        _backend = None
+    elif setting == 'PPTS_DATASET_VERSION_TTL':
+        forget_version()
+
+
+def make_key(name, params):
+    items = '&'.join('%s=%s' % item for item in sorted(params.items()))
+    return '%s?%s@%s' % (name, items, dataset_version())
+
+
+def get_or_render(name, params, render):
+    """The cached render() of graph name with params.
+
+    render() is only called on a miss, and whatever it returns (it has to
+    pickle) is stored for the next request.
+    """
+    backend = get_backend()
+    key = make_key(name, params)
+    value = backend.get(key)
+    if value is None:
+        value = render()
+        backend.set(key, value)
+    return value
@@ -0,0 +1,79 @@
+"""HTTP caching of the responses that only change with the data.
+
+The graphs, the index, the API and the exports are the same from one
+loadppts import to the next, so their views are wrapped with conditional(),
+which gives every successful response
+
+    ETag: "<dataset version>-<hash of what else it depends on>"
+    Last-Modified: <when the latest import finished>
+    Cache-Control: public, max-age=<PPTS_HTTP_MAX_AGE>
+
+and answers a GET whose If-None-Match (or If-Modified-Since) still matches
+with a 304 Not Modified before the view runs: nothing is rendered and, while
+the version is memoized (see ppts.cache.dataset_version), the database
+isn't queried either.
+
+    @conditional(lambda request, name: request.get_full_path())
+    def view(request, name):
+        ...
+
+The function gets the view's arguments and returns a string of whatever
+the response depends on besides the data (the path and query string, say),
+or None when the request is bad and should get the view's own error
+rather than a 304.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from ppts import cache
+
+
+def full_path(request, *args, **kwargs):
+    """The path and query string, for views that depend on nothing else."""
+    return request.get_full_path()
+
+
+def conditional(variant=full_path, vary=()):
+    """Decorates a view with ETags and Last-Modified from the dataset
+    version, see the module docstring. vary are the request headers the
+    response depends on, sent with the 304s as well."""
+
+    def etag(request, *args, **kwargs):
+        key = variant(request, *args, **kwargs)
+        if key is None:
+            return None
+        return '%s-%s' % (cache.dataset_version(), hashlib.sha1(
+            key.encode('utf-8')).hexdigest()[:16])
+
+    def last_modified(request, *args, **kwargs):
+        if variant(request, *args, **kwargs) is None:
+            return None
+        return cache.dataset_modified()
+
+    def decorator(view):
+        conditional_view = condition(etag, last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            if response.status_code >= 400:
+                # errors aren't cached: a later request could succeed
+                for header in ('ETag', 'Last-Modified'):
+                    if response.has_header(header):
+                        del response[header]
+            elif response.has_header('ETag'):
+                patch_cache_control(
+                    response, public=True,
+                    max_age=settings.PPTS_HTTP_MAX_AGE)
+            if vary:
+                patch_vary_headers(response, vary)
+            return response
+
+        return wrapper
+
+    return decorator
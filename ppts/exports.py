@@ -0,0 +1,199 @@
+"""Bulk exports of Records as CSV or NDJSON, one flat row per record.
+
+    /export/records.csv?record_type=PRJ
+    /export/records.ndjson?status=Accepted&compress=gzip
+    python manage.py exportppts prj.csv.gz --record-type PRJ
+
+The filters are the same as the JSON API's (see ppts.api). Each row is the
+record's own fields, its record type, planner and address, and from the
+child tables its project descriptions and net dwelling units.
+
+Records are read through a server-side cursor (on PostgreSQL) BATCH_SIZE
+at a time, and the child table values are looked up for each batch, so
+memory stays the same however many records are exported. Output is
+produced as it's read: the header goes out before the first query.
+
+A client that already has an export of the current dataset gets a 304
+rather than the whole file again, see ppts.conditional.
+"""
+import csv
+import io
+import itertools
+import math
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Sum
+from django.http import Http404
+from django.http import StreamingHttpResponse
+
+from ppts.conditional import conditional
+from ppts.models import ProjectFeature
+from ppts.models import Record
+from ppts import api
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+BATCH_SIZE = 2000
+
+# (column, Record lookup)
+RECORD_COLUMNS = [(name, name) for name in api.RECORD_FIELDS] + [
+    ('record_type', 'record_type_id'),
+    ('planner', 'planner__name'),
+    ('address', 'location__address'),
+    ('centroid_lon', 'location__centroid_lon'),
+    ('centroid_lat', 'location__centroid_lat'),
+]
+COLUMNS = [column for (column, lookup) in RECORD_COLUMNS] + [
+    'project_descriptions', 'net_units', 'net_affordable_units']
+
+
+def child_values(ids):
+    """Project descriptions and unit counts of the records with ids."""
+    descriptions = {}
+    for (record_id, description) in (
+            Record.project_description.through.objects.filter(
+                record_id__in=ids).order_by('projectdescription_id')
+            .values_list('record_id', 'projectdescription_id')):
+        descriptions.setdefault(record_id, []).append(description)
+    units = {}
+    for (record_id, type, net) in ProjectFeature.objects.filter(
+            record_id__in=ids, type__in=(ProjectFeature.MARKET_RATE,
+                                         ProjectFeature.AFFORDABLE),
+            ).values_list('record_id', 'type').annotate(
+                net=Sum('net')).order_by():
+        if net is None:
+            continue
+        total, affordable = units.get(record_id, (0, 0))
+        if type == ProjectFeature.AFFORDABLE:
+            affordable += net
+        units[record_id] = (total + net, affordable)
+    return descriptions, units
+
+
+def rows(records, batch_size=BATCH_SIZE):
+    """Yields a dict for each record, in id order, batch_size at a time."""
+    values = records.order_by('id').values_list(
+        *[lookup for (column, lookup) in RECORD_COLUMNS]).iterator(
+            chunk_size=batch_size)
+    while True:
+        batch = list(itertools.islice(values, batch_size))
+        if not batch:
+            return
+        descriptions, units = child_values([row[0] for row in batch])
+        for row in batch:
+            data = dict(zip(COLUMNS, row))
+            if isinstance(data['construct_cost'], float) and math.isnan(
+                    data['construct_cost']):
+                data['construct_cost'] = None
+            data['project_descriptions'] = descriptions.get(data['id'], [])
+            data['net_units'], data['net_affordable_units'] = units.get(
+                data['id'], (None, None))
+            yield data
+
+
+def csv_lines(rows):
+    """Yields the CSV text for rows, a header then a line per row."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    writer.writerow(COLUMNS)
+    yield flush()
+    for row in rows:
+        row['project_descriptions'] = ';'.join(row['project_descriptions'])
+        writer.writerow(['' if row[column] is None else row[column]
+                         for column in COLUMNS])
+        yield flush()
+
+
+def ndjson_lines(rows):
+    """Yields a JSON object per row, one per line."""
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(row) + '\n'
+
+
+def export(records, format, batch_size=BATCH_SIZE):
+    """Yields records in format as text, a line or so at a time."""
+    lines = csv_lines if format == 'csv' else ndjson_lines
+    return lines(rows(records, batch_size))
+
+
+def encode(chunks, size=64 * 1024):
+    """Encodes text chunks, joined into bytes of about size so a stream
+    isn't written a line at a time. The first chunk (the CSV header) goes
+    out on its own, straight away."""
+    chunks = iter(chunks)
+    for first in chunks:
+        yield first.encode('utf-8')
+        break
+    pending = []
+    length = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        pending.append(data)
+        length += len(data)
+        if length >= size:
+            yield b''.join(pending)
+            pending = []
+            length = 0
+    if pending:
+        yield b''.join(pending)
+
+
+def gzipped(chunks):
+    """gzip compresses a stream of bytes from encode()."""
+    compressor = zlib.compressobj(wbits=31)
+    chunks = iter(chunks)
+    for first in chunks:
+        # flushed, so the first bytes aren't held back in the compressor
+        yield compressor.compress(first) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        break
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream(records, format, gzip=False, batch_size=BATCH_SIZE):
+    """The export of records as a stream of bytes."""
+    chunks = encode(export(records, format, batch_size))
+    return gzipped(chunks) if gzip else chunks
+
+
+@conditional(lambda request, format:
+             request.get_full_path() if format in FORMATS else None)
+def records(request, format):
+    """Streams the records matching the API filters in the query string.
+
+    ?compress=gzip sends a .gz file instead.
+    """
+    if format not in FORMATS:
+        raise Http404('Records can be exported as %s' % ', '.join(FORMATS))
+    compress = request.GET.get('compress')
+    if compress not in (None, 'gzip'):
+        return api.error('compress can only be gzip')
+    try:
+        matching = api.filter_records(Record.objects.all(), request.GET)
+    except api.BadRequest as e:
+        return api.error(str(e))
+    filename = 'records.' + format
+    if compress:
+        response = StreamingHttpResponse(
+            stream(matching, format, gzip=True),
+            content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(
+            stream(matching, format), content_type=FORMATS[format])
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
@@ -0,0 +1,111 @@
+"""The graphs graphs_manager serves, by name.
+
+Each graph is a function returning a matplotlib Figure, registered in
+GRAPHS under its name with @graph:
+
+    @graph
+    def net_units_by_year():
+        fig, ax = figure()
+        ...
+        return fig
+
+and served at /graphs/net_units_by_year. The index page shows them in the
+order they're defined here.
+
+matplotlib (and numpy and PIL with it) takes over half a second to import,
+so this module doesn't import it, and the URLconf can import the views
+without paying for it: figure() imports it the first time a graph is drawn,
+in a worker that has to draw one.
+"""
+from django.db.models import Sum
+
+from ppts.models import RecordSummary
+
+# name: function, in the order they're defined
+GRAPHS = {}
+
+
+def graph(function):
+    """Registers a graph function under its name."""
+    GRAPHS[function.__name__] = function
+    return function
+
+
+def figure():
+    """A new Figure with one set of axes, as (figure, axes)."""
+    from matplotlib.figure import Figure
+    fig = Figure()
+    return fig, fig.subplots()
+
+
+@graph
+def sample_1():
+    """A sample graph with a straight line."""
+    fig, ax = figure()
+    x = range(0, 20, 1)
+    s = range(0, 40, 2)
+    ax.plot(x, s)
+
+    ax.set_xlabel('xlabel(X)')
+    ax.set_ylabel('ylabel(Y)')
+    ax.set_title('Sample Graph')
+
+    return fig
+
+
+@graph
+def sample_2():
+    """A sample graph with a pie chart of PRJ statuses"""
+    fig, ax = figure()
+
+    projects = RecordSummary.objects.filter(record_type__pk='PRJ').values(
+        'status').annotate(status_counts=Sum('records'))
+    status_counts = []
+    status = []
+    for item in projects:
+        status.append(item['status'])
+        status_counts.append(item['status_counts'])
+
+    ax.pie(status_counts, labels=status)
+
+    return fig
+
+
+@graph
+def net_units_by_year():
+    """Net new dwelling units by the year records were opened."""
+    fig, ax = figure()
+
+    years = RecordSummary.objects.filter(year__isnull=False).values(
+        'year').annotate(
+            units=Sum('net_units'),
+            affordable=Sum('net_affordable_units')).order_by('year')
+    year = [item['year'] for item in years]
+    affordable = [item['affordable'] for item in years]
+    market_rate = [item['units'] - item['affordable'] for item in years]
+    ax.bar(year, market_rate, label='Market rate')
+    ax.bar(year, affordable, bottom=market_rate, label='Affordable')
+
+    ax.set_xlabel('Year opened')
+    ax.set_ylabel('Net units')
+    ax.set_title('Net new units')
+    ax.legend()
+
+    return fig
+
+
+@graph
+def net_units_by_status():
+    """Net new dwelling units by record status."""
+    fig, ax = figure()
+
+    statuses = RecordSummary.objects.values('status').annotate(
+        units=Sum('net_units')).order_by('-units')
+    ax.barh([item['status'] for item in statuses],
+            [item['units'] for item in statuses])
+
+    ax.set_xlabel('Net units')
+    ax.set_title('Net new units by status')
+    fig.tight_layout()
+
+    return fig
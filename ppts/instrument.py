@@ -0,0 +1,205 @@
+"""Where loadppts spends its time and memory.
+
+    stats = Stats()
+    with stats.stage('read csv'):
+        chunk = next(reader)
+    stats.count('rows read', len(chunk))
+    stats.print_summary(sys.stdout)
+    stats.write_json('import.json')
+
+A stage adds up the wall time and the CPU time of every block run under
+its name. CPU time is the running thread's, so the stages of the writer
+thread (see ppts.writers.WriteQueue) don't take in the reader's, but their
+wall time overlaps it: the stages add up to more than the total. The
+stages a parse worker process timed come back with its result and are
+merged in with merge().
+
+Stats(trace_memory=True) also lists the lines that allocated the most
+memory still held at the end, with tracemalloc, which slows everything
+down a good deal until top_allocations() or close() stops it.
+Stats(profile=True) runs cProfile in every thread that enters profiled(),
+and dump_profile() writes their merged statistics, for `python -m pstats`
+or snakeviz.
+"""
+import cProfile
+import json
+import pstats
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+TOP_ALLOCATIONS = 10
+
+
+class Stats():
+    def __init__(self, trace_memory=False, profile=False):
+        # name -> [wall seconds, cpu seconds, calls], in order of first use
+        self.stages = OrderedDict()
+        self.counters = OrderedDict()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.trace_memory = trace_memory
+        self._allocations = None
+        # only stopped by close() if it's started here
+        self._tracing = trace_memory and not tracemalloc.is_tracing()
+        if self._tracing:
+            tracemalloc.start()
+        self._profiles = [] if profile else None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # what a parse worker sends back
+        return {'stages': self.stages, 'counters': self.counters}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.stages = state['stages']
+        self.counters = state['counters']
+
+    def add(self, name, wall, cpu, calls=1):
+        with self._lock:
+            stage = self.stages.setdefault(name, [0.0, 0.0, 0])
+            stage[0] += wall
+            stage[1] += cpu
+            stage[2] += calls
+
+    @contextmanager
+    def stage(self, name):
+        """Times the block as part of stage name."""
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - wall,
+                     time.thread_time() - cpu)
+
+    def timed(self, name, iterable):
+        """Yields the items of iterable, timing the wait for each one as
+        stage name."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        """Adds in the stages and counters of other."""
+        for (name, (wall, cpu, calls)) in other.stages.items():
+            self.add(name, wall, cpu, calls)
+        for (name, n) in other.counters.items():
+            self.count(name, n)
+
+    @contextmanager
+    def profiled(self):
+        """Runs the block under the current thread's profiler, if
+        profiling."""
+        if self._profiles is None:
+            yield
+            return
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+
+    def dump_profile(self, path):
+        pstats.Stats(*self._profiles).dump_stats(path)
+
+    def top_allocations(self):
+        """(file:line, MB, blocks) of the lines holding the most memory."""
+        if not self.trace_memory:
+            return []
+        if self._allocations is None:
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__)])
+            self._allocations = [
+                ('%s:%d' % (stat.traceback[0].filename,
+                            stat.traceback[0].lineno),
+                 stat.size / 2**20, stat.count)
+                for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]]
+            # the snapshot is all the tracing was for
+            self.close()
+        return self._allocations
+
+    def close(self):
+        """Stops tracing memory, if these stats started it."""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+    def report(self, rows_counter='rows read'):
+        """Everything measured, as a dict for JSON."""
+        wall = time.perf_counter() - self.started
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        rows = self.counters.get(rows_counter, 0)
+        return {
+            'wall_seconds': wall,
+            'cpu_seconds': time.process_time() - self.cpu_started,
+            'worker_cpu_seconds': children.ru_utime + children.ru_stime,
+            'rows_per_second': rows / wall if wall else 0,
+            'peak_rss_mb': peak_rss_mb(resource.RUSAGE_SELF),
+            'worker_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+            'stages': OrderedDict(
+                (name, {'wall_seconds': wall, 'cpu_seconds': cpu,
+                        'calls': calls})
+                for (name, (wall, cpu, calls)) in self.stages.items()),
+            'counters': self.counters,
+            'top_allocations': [
+                {'line': line, 'mb': mb, 'blocks': blocks}
+                for (line, mb, blocks) in self.top_allocations()],
+        }
+
+    def print_summary(self, out=sys.stdout, report=None):
+        report = report or self.report()
+        out.write('%-40s %9s %9s %7s\n' % ('stage', 'wall s', 'cpu s',
+                                           'calls'))
+        for (name, stage) in report['stages'].items():
+            out.write('%-40s %9.2f %9.2f %7d\n' % (
+                name, stage['wall_seconds'], stage['cpu_seconds'],
+                stage['calls']))
+        out.write('%-40s %9.2f %9.2f\n' % (
+            'total', report['wall_seconds'], report['cpu_seconds']))
+        for (name, n) in report['counters'].items():
+            out.write('%-40s %9d\n' % (name, n))
+        memory = 'peak memory %.0f MB' % report['peak_rss_mb']
+        if report['worker_peak_rss_mb']:
+            memory += ', %.0f MB in a worker' % report['worker_peak_rss_mb']
+        if report['rows_per_second']:
+            memory = '%.0f rows/s, %s' % (report['rows_per_second'], memory)
+        out.write(memory + '\n')
+        for allocation in report['top_allocations']:
+            out.write('%8.1f MB %9d blocks  %s\n' % (
+                allocation['mb'], allocation['blocks'], allocation['line']))
+
+    def write_json(self, path, report=None):
+        with open(path, 'w') as f:
+            json.dump(report or self.report(), f, indent=2)
+            f.write('\n')
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident memory of this process (or its largest finished
+    child) so far, in MB."""
+    peak = resource.getrusage(who).ru_maxrss
+    #kilobytes on Linux, bytes on macOS
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak / 1024
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from ppts import snapshots
+from ppts.instrument import Stats
+
+
+class Command(BaseCommand):
+    help = """Writes the imported PPTS tables to a columnar snapshot.
+
+Run like: python manage.py dumpppts /path/to/snapshot
+
+The snapshot is a directory with one Parquet (or Arrow, with --format arrow)
+file per table. Load it into an empty database with:
+    python manage.py loadppts /path/to/snapshot
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory')
+        parser.add_argument('--format', choices=snapshots.FORMATS,
+            default='parquet',
+            help=('parquet (default) is compressed; arrow is larger but '
+                  'loads without decoding'))
+
+    def handle(self, *args, **options):
+        stats = Stats()
+        with stats.stage('dump'):
+            counts = snapshots.dump(options['directory'], options['format'])
+        for (model, count) in counts:
+            stats.count('%s rows' % model._meta.db_table, count)
+        stats.print_summary(self.stdout)
@@ -0,0 +1,70 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.http import QueryDict
+
+from ppts import api
+from ppts import exports
+from ppts.models import Record
+
+
+class Command(BaseCommand):
+    help = """Exports the imported records as CSV or NDJSON.
+
+Run like: python manage.py exportppts prj.csv --record-type PRJ
+
+The output is one row per record, as served by /export/records.csv (see
+ppts/exports.py). It's gzipped when the filename ends in .gz, or with
+--gzip. Use - to write to stdout. The format comes from the filename
+(.csv, .ndjson) unless --format is given.
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename')
+        parser.add_argument('--format', choices=exports.FORMATS)
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--batch-size', type=int,
+            default=exports.BATCH_SIZE,
+            help='Records read and joined to their child tables at a time')
+        # the same filters as the API, see ppts/api.py
+        parser.add_argument('--status', action='append')
+        parser.add_argument('--record-type', action='append')
+        parser.add_argument('--project-description', action='append')
+        for name in ('opened-after', 'opened-before', 'closed-after',
+                     'closed-before'):
+            parser.add_argument('--' + name, metavar='YYYY-MM-DD')
+        parser.add_argument('--bbox', metavar='WEST,SOUTH,EAST,NORTH')
+        parser.add_argument('--near', metavar='LON,LAT,METERS')
+
+    def handle(self, *args, **options):
+        filename = options['filename']
+        gzip = options['gzip'] or filename.endswith('.gz')
+        format = options['format']
+        if format is None:
+            name = filename[:-3] if filename.endswith('.gz') else filename
+            format = name.rsplit('.', 1)[-1]
+            if format not in exports.FORMATS:
+                raise CommandError(
+                    "Can't tell the format from %s, use --format" % filename)
+        params = QueryDict(mutable=True)
+        for name in ('status', 'record_type', 'project_description'):
+            if options[name]:
+                params.setlist(name, options[name])
+        for name in ('opened_after', 'opened_before', 'closed_after',
+                     'closed_before', 'bbox', 'near'):
+            if options[name]:
+                params[name] = options[name]
+        try:
+            records = api.filter_records(Record.objects.all(), params)
+        except api.BadRequest as e:
+            raise CommandError(str(e).replace('_', '-'))
+
+        out = sys.stdout.buffer if filename == '-' else open(filename, 'wb')
+        try:
+            for chunk in exports.stream(
+                    records, format, gzip, options['batch_size']):
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from ppts import synthetic
+
+
+class Command(BaseCommand):
+    help = """Writes a synthetic PPTS export, for trying out loadppts.
+
+Run like: python manage.py fakeppts /path/to/ppts.csv --rows 100000
+
+The file has the columns of the real export and realistic values, see
+ppts/synthetic.py. The same --rows and --seed always give the same file.
+"""
+
+    def add_arguments(self, parser):
+        parser.add_argument('filename')
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        with open(options['filename'], 'w', newline='') as f:
+            synthetic.write(f, options['rows'], options['seed'])
@@ -1,9 +1,19 @@
 from django.core.management.base import BaseCommand
-# from django.core.management.base import CommandError
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
 
-import time
+import collections
+import itertools
+import multiprocessing
+import os
 import pandas as pd
 
+from django.db import connection
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from ppts.models import DataImport
 from ppts.models import DwellingType
 from ppts.models import LandUse
 from ppts.models import Location
@@ -12,6 +22,16 @@ from ppts.models import ProjectFeature
 from ppts.models import ProjectDescription
 from ppts.models import Record
 from ppts.models import RecordType
+from ppts import cache
+from ppts import instrument
+from ppts import transform
+from ppts.relations import RecordLinks
+from ppts import search
+from ppts import shadow
+from ppts import snapshots
+from ppts import sources
+from ppts import summaries
+from ppts import writers
 
 
 class Command(BaseCommand):
@@ -20,22 +40,95 @@ class Command(BaseCommand):
 Run like: rm db.sqlite3 && \
     python manage.py migrate && \
     python manage.py loadppts /path/to/ppts.csv
+
+To refresh a database that already holds an import, run:
+    python manage.py loadppts /path/to/ppts.csv --incremental
+
+The file may be gzip, bz2, xz or zip compressed, and - reads it from stdin:
+    zcat ppts.csv.gz | python manage.py loadppts -
+
+Rows are committed in batches. If an import stops partway, run it again
+with --resume to carry on after the last batch that was written.
+
+Given a directory, loads a snapshot written by dumpppts into an empty
+database instead, which skips parsing the CSV altogether.
+
+At the end it prints the wall and CPU time of each stage of the import,
+the rows written to each table and the peak memory (see
+ppts/instrument.py). --report writes the same as JSON, to compare
+releases; --profile writes cProfile statistics of every thread.
+
+To replace the data of a live site, load the file into a shadow database
+and swap it in once it's complete, see ppts/shadow.py:
+    python manage.py loadppts /path/to/ppts.csv --shadow
+On SQLite that replaces the database file, which has to be allowed with
+--allow-file-swap.
 """
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        #record_type_category -> RecordType category, cleaned up
         self.record_types = dict()
+        self._record_type_rows = set()
+        #planner_id -> Planner id
         self._planners = dict()
-        self._project_descriptions = dict()
+        self._planner_counter = 1
+        #geometry_key of each polygon -> Location id
         self._locations = dict()
         self._location_counter = 0
-        self._lost_children = dict()
-        self._lost_parents = dict()
+        self._links = RecordLinks()
+        self._record_counter = 0
+        #the DataImport recording how far this run got
+        self.checkpoint = None
+        #state of the previous import, only used with --incremental
+        self.incremental = False
+        self.writer = None
+        self._existing = dict()
+        self._unseen = set()
+        self._touched = set()
+        self._replaced = set()
+        self.stats = instrument.Stats()
 
     def add_arguments(self, parser):
-        parser.add_argument('filename')
+        parser.add_argument('filename',
+            help=('the PPTS CSV export, optionally compressed; - for stdin; '
+                  'or a dumpppts snapshot directory'))
         parser.add_argument('--quicktest',action='store_true',
-            help='import only 1000 rows')
+            help='import only the first chunk of rows')
+        parser.add_argument('--incremental', action='store_true',
+            help=('update a previously loaded database in place, writing '
+                  'only new, changed and deleted records'))
+        parser.add_argument('--resume', action='store_true',
+            help=('carry on with an import of the same file that stopped '
+                  'partway, after the last batch it committed'))
+        parser.add_argument('--shadow', action='store_true',
+            help=('load into a shadow database beside the live one, then '
+                  'swap it in all at once'))
+        parser.add_argument('--allow-file-swap', action='store_true',
+            help=('let --shadow replace a SQLite database file; writes by '
+                  'connections opened before the swap are lost'))
+        parser.add_argument('--workers', type=int, default=1,
+            help=('number of processes parsing the CSV; rows are still '
+                  'written in file order by this process'))
+        parser.add_argument('--writer', choices=sorted(writers.WRITERS),
+            help=('how rows are written to the database (default: copy on '
+                  'PostgreSQL, insert on SQLite, orm elsewhere)'))
+        parser.add_argument('--chunksize', type=int, default=1000,
+            help='rows read from the CSV at a time (default: 1000)')
+        parser.add_argument('--batch-size', type=int, default=10000,
+            help=('records written per transaction; a resumed import '
+                  'starts after the last one (default: 10000)'))
+        parser.add_argument('--insert-batch-size', type=int,
+            help=('rows per INSERT statement for the orm and insert '
+                  'writers (default: the whole batch)'))
+        parser.add_argument('--report', metavar='PATH',
+            help='write the timings and counts to PATH as JSON')
+        parser.add_argument('--profile', metavar='PATH',
+            help=('write cProfile statistics to PATH, for python -m pstats '
+                  'or snakeviz'))
+        parser.add_argument('--trace-memory', action='store_true',
+            help=('list the lines holding the most memory at the end, '
+                  'with tracemalloc (much slower)'))
 
     def pd_date(self, d):
         if pd.isnull(d) or isinstance(d, str):
@@ -50,13 +143,143 @@ Run like: rm db.sqlite3 && \
     def make_enum(self, obj):
         d = dict()
         for (col, _ignore) in obj.CHOICES:
-            d[col] = obj.objects.create(type=col)
+            d[col], _created = obj.objects.get_or_create(type=col)
         return d
 
+    def load_lookups(self):
+        """Seeds the lookup tables from the database, so that rows referring
+        to known planners, record types and locations reuse them.
+        """
+        for category in RecordType.objects.values_list('category', flat=True):
+            self.record_types[category] = category
+            self._record_type_rows.add(category)
+        for (planner_id, code) in Planner.objects.values_list(
+                'id', 'planner_id'):
+            self._planners[code] = planner_id
+        self._planner_counter = self.next_id(Planner, 1)
+        geoms = Location.objects.values_list('id', 'the_geom')
+        for (loc_id, geom) in geoms.iterator():
+            self._locations[transform.geometry_key(geom)] = loc_id
+
+    def load_existing(self):
+        """Reads the state left behind by a previous import.
+
+        Every existing record is indexed by record_id so rows can be diffed
+        against it.
+        """
+        self._location_counter = self.next_id(Location)
+        self._record_counter = self.next_id(Record)
+        # If a record_id shows up more than once, the lowest id is matched
+        # and the other copies are treated as deleted.
+        existing = Record.objects.order_by('-id').values_list(
+            'id', 'record_id', 'source_hash')
+        for (pk, record_id, source_hash) in existing.iterator():
+            self._existing[record_id] = (pk, source_hash)
+            self._unseen.add(pk)
+
+    def start_import(self, options):
+        """Returns the DataImport to record this run's progress in.
+
+        With --resume that's the unfinished import of the same file, and
+        the state it left behind is loaded.
+        """
+        filename = options['filename']
+        if not options['resume']:
+            if not self.incremental and Record.objects.exists():
+                raise CommandError(
+                    'The database already holds an import. Use --incremental '
+                    'to update it, or --resume if it stopped partway.')
+            return DataImport.objects.create(
+                filename=filename,
+                file_hash=sources.file_hash(filename),
+                incremental=self.incremental)
+        if self.incremental:
+            raise CommandError(
+                "--incremental imports don't need --resume: run the same "
+                "command again, the batches already written are unchanged "
+                "and get skipped.")
+        if filename == '-':
+            raise CommandError("Can't resume an import read from stdin.")
+        checkpoint = DataImport.objects.filter(
+            finished__isnull=True).order_by('-id').first()
+        if checkpoint is None or checkpoint.incremental:
+            raise CommandError('There is no unfinished import to resume.')
+        if checkpoint.file_hash != sources.file_hash(filename):
+            raise CommandError(
+                '%s is not the file the unfinished import was reading (%s).'
+                % (filename, checkpoint.filename))
+        self.resume(checkpoint, filename, options['chunksize'])
+        return checkpoint
+
+    def resume(self, checkpoint, filename, chunksize):
+        """Picks up the state of an import after its last checkpoint."""
+        self._location_counter = checkpoint.location_counter
+        self._record_counter = checkpoint.record_counter
+        # The parent/child links are only written at the end, so the links
+        # of the rows already done are read again, and nothing else. Same
+        # chunks as the import, so the columns get the same types.
+        source = sources.open_source(filename)
+        done = pd.read_csv(
+            source.file, chunksize=chunksize, nrows=checkpoint.rows,
+            usecols=['record_id', 'parent', 'children'])
+        pk = 0
+        for chunk in done:
+            for row in chunk.itertuples():
+                self._links.add(pk, row.record_id, row.parent, row.children)
+                pk += 1
+        source.close()
+        self.stdout.write('Resuming after %d rows' % checkpoint.rows)
+
+    def save_checkpoint(self, batch):
+        """Records that the input is written up to the end of batch."""
+        self.checkpoint.rows = batch.rows
+        self.checkpoint.location_counter = batch.location_counter
+        self.checkpoint.record_counter = batch.record_counter
+        self.checkpoint.save()
+
+    def next_id(self, model, first=0):
+        max_id = model.objects.aggregate(Max('id'))['id__max']
+        if max_id is None:
+            return first
+        return max_id + 1
+
+    def diff_row(self, row, source_hash):
+        """Matches a row against the previous import.
+
+        Returns the primary key the row's Record should have, and whether the
+        record needs to be (re)written. Changed records keep their primary key.
+        """
+        if row.record_id in self._existing:
+            pk, old_hash = self._existing.pop(row.record_id)
+            self._unseen.discard(pk)
+            if old_hash == source_hash:
+                return pk, False
+            self._replaced.add(pk)
+        else:
+            pk = self._record_counter
+            self._record_counter += 1
+        self._touched.add(pk)
+        return pk, True
+
+    def delete_records(self, pks):
+        """Deletes records along with their child rows."""
+        pks = list(pks)
+        # keep well under SQLite's limit on query parameters
+        for start in range(0, len(pks), 500):
+            ids = pks[start:start + 500]
+            DwellingType.objects.filter(record_id__in=ids).delete()
+            ProjectFeature.objects.filter(record_id__in=ids).delete()
+            LandUse.objects.filter(record_id__in=ids).delete()
+            # also deletes the record's rows in both through-tables
+            Record.objects.filter(id__in=ids).delete()
+
     def record_type(self, row):
+        """Returns the RecordType key for a row, and the row to write for it
+        if the record type is new (otherwise None).
+        """
         category = row.record_type_category
         if category in self.record_types:
-            rt = self.record_types[row.record_type_category]
+            return self.record_types[category], None
         else:
             clean_successful = True
             #check if category is clean
@@ -67,320 +290,391 @@ Run like: rm db.sqlite3 && \
                 #if the first instance of a record_type_category has record_type in a nonstandard format
                 #If this happens, the unit tests should catch it.
                 clean_category = row.record_type[-4:-1]
-            rt = RecordType(
-                category=clean_category,
-                name=row.record_type,
-                subtype=row.record_type_subtype,
-                type=row.record_type_type,
-                group=row.record_type_group,
-                module=row.module)
-            # print("Creating %s" % rt.__dict__)
-            rt.save()
-            self.record_types[category] = rt
-        return rt
+            self.record_types[category] = clean_category
+            #two spellings of a category can clean up to the same one, the
+            #first one seen is kept
+            if clean_category in self._record_type_rows:
+                return clean_category, None
+            self._record_type_rows.add(clean_category)
+            return clean_category, (clean_category,
+                                    row.record_type,
+                                    row.record_type_subtype,
+                                    row.record_type_type,
+                                    row.record_type_group,
+                                    row.module)
 
     def planner(self, row):
+        """Returns the Planner id for a row, and the row to write for it if
+        the planner is new (otherwise None).
+        """
         if row.planner_id in self._planners:
-            planner = self._planners[row.planner_id]
-        else:
-            planner = Planner.objects.create(
-                planner_id=row.planner_id,
-                name=row.planner_name,
-                email=row.planner_email,
-                phone=row.planner_phone)
-            self._planners[row.planner_id] = planner
-        return planner
-
-    def location(self, row):
-        #TODO: if possible, implement differently so that we're not wasting so much memory on _locations dict
-        newloc = row.the_geom not in self._locations
-        if newloc:
-            loc = Location(id = self._location_counter,
-                the_geom=row.the_geom,
-                shape_length=row.Shape_Length,
-                shape_area=row.Shape_Area,
-                address=row.address)
-            self._locations[row.the_geom] = loc
-            self._location_counter += 1
-        else:
-            loc = self._locations[row.the_geom]
-        return loc, newloc
-
-    def project_descriptions(self, row):
-        # The choices on ProjectDescription are the column names in the
-        # original data
-        pds = []
-        for (col, _ignore) in ProjectDescription.CHOICES:
-            checked = getattr(row, col, False)
-            if checked and not pd.isnull(checked):
-                if (isinstance(checked, str) and
-                        checked.lower() == "unchecked" and
-                        checked.lower() == "no"):
-                    continue
-                pds.append(self._project_descriptions[col])
-        return pds
-
-    def dwelling_type(self, row, record):
-        prefix = "RESIDENTIAL"
-        dts = []
-        for (infix, _ignore) in DwellingType.CHOICES:
-            exist = self.null_to_default(getattr(row, "_".join([prefix, infix, "EXIST"]), 0), 0)
-            prop = self.null_to_default(getattr(row, "_".join([prefix, infix, "PROP"]), 0), 0)
-            net = self.null_to_default(getattr(row, "_".join([prefix, infix, "NET"]), 0), 0)
-            area = self.null_to_default(getattr(row, "_".join([prefix, infix, "AREA"]), 0), 0)
-            if any([exist, prop, net, area]):
-                dts.append(DwellingType(
-                    record=record,
-                    type=infix,
-                    exist=exist,
-                    proposed=prop,
-                    net=net,
-                    area=area))
-        return dts
-
-    def project_feature(self, row, record):
-        prefix = "PRJ_FEATURE"
-        pfs = []
-        for (infix, _ignore) in ProjectFeature.CHOICES:
-            other_name = ""
-            if infix == ProjectFeature.OTHER:
-                other_name = self.null_to_default(getattr(row, "_".join([prefix, infix]), ""), "")
-            exist = self.null_to_default(getattr(row, "_".join([prefix, infix, "EXIST"]), 0), 0)
-            #prop = self.null_to_default(getattr(row, "_".join([prefix, infix, "PROP"]), 0), 0)
-            net = self.null_to_default(getattr(row, "_".join([prefix, infix, "NET"]), 0), 0)
-            #if any([exist, prop, net, other_name]):
-            if any([exist, net, other_name]):
-                pfs.append(ProjectFeature(
-                    record=record,
-                    type=infix,
-                    other_name=other_name,
-                    exist=exist,
-                    #proposed=prop,
-                    proposed = exist+net,
-                    net=net))
-        return pfs
-
-    def land_use(self, row, record):
-        prefix = "LAND_USE"
-        lus = []
-        for (infix, _ignore) in LandUse.CHOICES:
-            exist = self.null_to_default(getattr(row, "_".join([prefix, infix, "EXIST"]), 0), 0)
-            prop = self.null_to_default(getattr(row, "_".join([prefix, infix, "PROP"]), 0), 0)
-            net = self.null_to_default(getattr(row, "_".join([prefix, infix, "NET"]), 0), 0)
-            if any([exist, prop, net]):
-                lus.append(LandUse(
-                    record=record,
-                    type=infix,
-                    exist=exist,
-                    proposed=prop,
-                    net=net))
-        return lus
-    
-    def parent_relations(self, row, record):
-        #self._lost_children maps record_ids of children that have not yet found parents
-        #to dicts whose keys are the record_ids of the lost children, and values are the ids
-        #self._lost_parents is same as above but with children and parents swapped
-        #rel is a list of (child id, parent id) tuples
-        
-        rel = []
-        #check if this row relates to previous rows
-        if row.record_id in self._lost_parents:
-            found_parents = self._lost_parents.pop(row.record_id)
-        else:
-            found_parents = dict()
-        if row.record_id in self._lost_children:
-            found_children = self._lost_children.pop(row.record_id)
-        else:
-            found_children = dict()
-        
-        #loop through the record_ids of parents of this row
-        if not pd.isnull(row.parent):
-            row_parents = row.parent.split(',')
-            for row_parent in row_parents:
-                #if a match for the parent is found, append the match to rel
-                if row_parent in found_parents:
-                    rel.append((record.id,found_parents[row_parent]))
-                else:
-                    #if a match for the parent is not found, add this record to lost_children
-                    if row_parent not in self._lost_children:
-                        self._lost_children[row_parent] = dict()
-                    self._lost_children[row_parent][row.record_id] = record.id
-        
-        #do the same for children
-        if not pd.isnull(row.children):
-            row_children = row.children.split(',')
-            for row_child in row_children:
-                if row_child in found_children:
-                    rel.append((found_children[row_child],record.id))
-                else:
-                    if row_child not in self._lost_parents:
-                        self._lost_parents[row_child] = dict()
-                    self._lost_parents[row_child][row.record_id] = record.id
-        
-        return rel
+            return self._planners[row.planner_id], None
+        planner_id = self._planner_counter
+        self._planner_counter += 1
+        self._planners[row.planner_id] = planner_id
+        return planner_id, (planner_id,
+                            row.planner_id,
+                            row.planner_name,
+                            row.planner_email,
+                            row.planner_phone)
+
+    def location(self, row, key):
+        """Returns the Location id for a row, and the row to write for it if
+        the location is new (otherwise None).
+
+        key is the transform.geometry_key of the row's the_geom. Only keys
+        and ids are kept between rows, not the polygons, which can be large.
+        A row with no the_geom has no Location: its id is None.
+        """
+        if pd.isnull(row.the_geom):
+            return None, None
+        if key in self._locations:
+            return self._locations[key], None
+        loc_id = self._location_counter
+        self._location_counter += 1
+        self._locations[key] = loc_id
+        return loc_id, (loc_id,
+                        row.the_geom,
+                        self.null_to_default(row.Shape_Length, None),
+                        self.null_to_default(row.Shape_Area, None),
+                        self.null_to_default(row.address, '')
+                        ) + transform.geometry_bounds(row.the_geom)
 
     def handle(self, *args, **options):
-        comp_timer = Timer()
+        self.stats = instrument.Stats(
+            trace_memory=options['trace_memory'],
+            profile=bool(options['profile']))
+        try:
+            with self.stats.profiled():
+                self.load(options)
+            report = self.stats.report()
+        finally:
+            self.stats.close()
+        self.stats.print_summary(self.stdout, report)
+        if options['report']:
+            self.stats.write_json(options['report'], report)
+        if options['profile']:
+            self.stats.dump_profile(options['profile'])
+
+    def load(self, options):
         # import ipdb
         # ipdb.set_trace()
-        self._project_descriptions = self.make_enum(ProjectDescription)
+        self.incremental = options['incremental']
+        self.writer = writers.get_writer(
+            connection, options['writer'], options['insert_batch_size'])
+        if options['shadow']:
+            self.load_shadow(options)
+        elif os.path.isdir(options['filename']):
+            self.load_snapshot(options)
+        else:
+            self.load_csv(options)
+
+    def load_csv(self, options):
+        """Imports a CSV export."""
+        with self.stats.stage('read lookups'):
+            # the through rows refer to every ProjectDescription type
+            self.make_enum(ProjectDescription)
+            self.load_lookups()
+            if self.incremental:
+                self.load_existing()
+        self.checkpoint = self.start_import(options)
+        #dates are parsed in parse_chunk, possibly in another process
+        source = sources.open_source(options['filename'])
+        #rows a resumed import already wrote are skipped unparsed
+        done = self.checkpoint.rows
         data_reader = pd.read_csv(
-            options['filename'],
-            parse_dates=[
-                "date_opened",
-                "date_closed",
-                "BOS_1ST_READ",
-                "BOS_2ND_READ",
-                "COM_HEARING",
-                "MAYORAL_SIGN",
-                "TRANSMIT_DATE_BOS",
-                "COM_HEARING_DATE_BOS",
-            ],
-            infer_datetime_format=True,
-            chunksize=1000)
-        records = []
-        dwelling_types = []
-        project_features = []
-        land_uses = []
-        locations_unique = []
-        record_relations = []
-        i = -1
-        project_description_map = dict()
-        locations_list = []
-        #sadly there is no way to count the number of rows without reading entire file first.
-        #print("Creating %d rows" % len(data))
-        for chunk in data_reader:
-            print(i+1)
-            for row in chunk.itertuples():
-                i += 1
-                record = Record(
-                    id=i,
-                    planner=self.planner(row),
-                    #location=loc,
-                    record_type=self.record_type(row),
-                    record_id=row.record_id,
-                    # TODO: parent=
-                    object_id=row.OBJECTID,
-                    template_id=row.templateid,
-                    name=row.record_name,
-                    description=row.description,
-                    status=row.record_status,
-                    construct_cost=row.constructcost,
-                    related_building_permit=row.RELATED_BUILDING_PERMIT,
-                    acalink=row.acalink,
-                    aalink=row.aalink,
-                    date_opened=self.pd_date(row.date_opened),
-                    date_closed=self.pd_date(row.date_closed),
-                    bos_1st_read=self.pd_date(row.BOS_1ST_READ),
-                    bos_2nd_read=self.pd_date(row.BOS_2ND_READ),
-                    com_hearing=self.pd_date(row.COM_HEARING),
-                    mayoral_sign=self.pd_date(row.MAYORAL_SIGN),
-                    transmit_date_bos=self.pd_date(row.TRANSMIT_DATE_BOS),
-                    com_hearing_date_bos=self.pd_date(row.COM_HEARING_DATE_BOS),
-                    mcd_referral=row.MCD_REFERRAL,
-                    environmental_review=row.ENVIRONMENTAL_REVIEW_TYPE,
-                )
-                
-                record_relations.extend( self.parent_relations(row, record) )
-                loc,newloc = self.location(row)
-                if newloc:
-                    locations_unique.append(loc)
-                locations_list.append(loc.id)
-                
-                project_description_map[i] = self.project_descriptions(row)
-                records.append(record)
-                dwelling_types.extend(self.dwelling_type(row, record))
-                project_features.extend(self.project_feature(row, record))
-                land_uses.extend(self.land_use(row, record))
+            source.file, chunksize=options['chunksize'],
+            skiprows=range(1, done + 1))
+        if options['quicktest']:
             #early abort for testing purposes
-            if options['quicktest']:
-                break
-            if len(records) > 10000:
-                Location.objects.bulk_create(locations_unique)
-                for rid, lid in enumerate(locations_list):
-                    records[rid].location_id = lid
-                Record.objects.bulk_create(records)
-                rpis = []
-                for (rid, pds) in project_description_map.items():
-                    for pdi in pds:
-                        rpis.append(Record.project_description.through(
-                            projectdescription_id=pdi.pk,
-                            record_id=rid))
-                Record.project_description.through.objects.bulk_create(rpis)
-                rel = []
-                for relation in record_relations:
-                    rel.append(Record.parent.through(from_record_id = relation[0],to_record_id = relation[1]))
-                Record.parent.through.objects.bulk_create(rel)
-                DwellingType.objects.bulk_create(dwelling_types)
-                ProjectFeature.objects.bulk_create(project_features)
-                LandUse.objects.bulk_create(land_uses)
-
-                project_description_map = dict()
-                records = []
-                dwelling_types = []
-                project_features = []
-                land_uses = []
-                locations_unique = []
-                locations_list = []
-                record_relations = []
-        
-        Location.objects.bulk_create(locations_unique)
-        for rid, lid in enumerate(locations_list):
-            records[rid].location_id = lid
-        Record.objects.bulk_create(records)
-        rpis = []
-        for (rid, pds) in project_description_map.items():
-            for pdi in pds:
-                rpis.append(Record.project_description.through(
-                    projectdescription_id=pdi.pk,
-                    record_id=rid))
-        Record.project_description.through.objects.bulk_create(rpis)
-        rel = []
-        for relation in record_relations:
-            rel.append(Record.parent.through(from_record_id = relation[0],to_record_id = relation[1]))
-        Record.parent.through.objects.bulk_create(rel)
-        DwellingType.objects.bulk_create(dwelling_types)
-        ProjectFeature.objects.bulk_create(project_features)
-        LandUse.objects.bulk_create(land_uses)
-        
-        project_description_map = dict()
-        records = []
-        dwelling_types = []
-        project_features = []
-        land_uses = []
-        locations_unique = []
-        locations_list = []
-        record_relations = []
-
-        comp_timer.printreport()
-
-
-# quick timer class for debugging computation time
-class Timer():
-    def __init__(self, start=True):
-        self.paused = True
-        self.runtime = 0
-        if start:
-            self.start()
-
-    def pause(self):
-        if(not self.paused):
-            self.runtime += (time.time() - self.checkpoint)/60
-            self.paused = True
-
-    def start(self):
-        if(self.paused):
-            self.checkpoint = time.time()
-            self.paused = False
-
-    def report(self):
-        self.pause()
-        return self.runtime
-
-    def printreport(self):
-        print('Time passed: %.2f min' % self.report())
-
-    def restart(self):
-        self.pause()
-        self.runtime = 0
-        self.start()
+            data_reader = itertools.islice(data_reader, 1)
+        data_reader = self.stats.timed('read csv', data_reader)
+        parsed_chunks = self.parse_chunks(data_reader, options['workers'])
+        #Batches are written by another thread while the next one is read.
+        #It starts with the first batch, after the parse_chunks workers are
+        #forked.
+        with writers.WriteQueue(self.flush, connection) as pending:
+            rows = self.read_batches(
+                parsed_chunks, source, done, options['batch_size'], pending)
+        source.close()
+        self.stdout.write('%d rows, %s read' % (rows, source.progress()))
+        #the stages inside are timed on their own as well
+        with self.stats.stage('finish import'):
+            with transaction.atomic():
+                self.write_relations()
+                if self.incremental:
+                    #records that were not in the file any more
+                    with self.stats.stage('delete records'):
+                        self.delete_records(self._unseen)
+                        Location.objects.filter(record__isnull=True).delete()
+                #planners were written with their ids
+                with connection.cursor() as cursor:
+                    for sql in connection.ops.sequence_reset_sql(
+                            no_style(), [Planner]):
+                        cursor.execute(sql)
+                self.rebuild_summaries()
+                self.checkpoint.finished = timezone.now()
+                self.checkpoint.save()
+        with self.stats.stage('optimize search'):
+            search.optimize(connection)
+        #a finished import is a new dataset version, for cached graphs
+        cache.forget_version()
+        if self.incremental:
+            self.stdout.write('%d records added, %d changed, %d deleted' % (
+                len(self._touched) - len(self._replaced),
+                len(self._replaced),
+                len(self._unseen)))
+
+    def read_batches(self, parsed_chunks, source, done, batch_size, pending):
+        """Turns parsed chunks into Batches of batch_size records or more,
+        putting each on the pending queue.
+
+        Everything here happens in memory: the database belongs to the
+        thread writing the batches. done is the number of rows a resumed
+        import skipped. Returns the number of rows read in all.
+        """
+        batch = Batch()
+        i = done - 1
+        #sadly there is no way to count the number of rows without reading entire file first.
+        for parsed in parsed_chunks:
+            self.stdout.write('%d rows, %s read' % (i+1, source.progress()))
+            self.stats.count('rows read', len(parsed.rows))
+            with self.stats.stage('assemble rows'):
+                pks = self.assemble(parsed, batch)
+            i += len(pks)
+            if len(batch.records) >= batch_size:
+                self.end_batch(batch, i+1, pending)
+                batch = Batch()
+        self.end_batch(batch, i+1, pending)
+        return i+1
+
+    def assemble(self, parsed, batch):
+        """Adds the rows of a parsed chunk to batch, diffed against the
+        previous import with --incremental. Returns the primary key of
+        each row, None for the rows left as they were."""
+        #primary key of each row in the chunk, None if not written
+        pks = []
+        for (position, row) in enumerate(parsed.rows.itertuples()):
+            source_hash = parsed.hashes[position]
+            if self.incremental:
+                pk, write = self.diff_row(row, source_hash)
+            else:
+                pk, write = self._record_counter, True
+                self._record_counter += 1
+            self._links.add(pk, row.record_id, row.parent, row.children)
+            if not write:
+                pks.append(None)
+                continue
+            pks.append(pk)
+            loc_id, newloc = self.location(
+                row, parsed.geometry_keys[position])
+            if newloc:
+                batch.locations.append(newloc)
+            planner_id, newplanner = self.planner(row)
+            if newplanner:
+                batch.planners.append(newplanner)
+            category, newrt = self.record_type(row)
+            if newrt:
+                batch.record_types.append(newrt)
+            record = (
+                pk,
+                planner_id,
+                loc_id,
+                category,
+                row.record_id,
+                # TODO: parent=
+                row.OBJECTID,
+                row.templateid,
+                row.record_name,
+                row.description,
+                row.record_status,
+                row.constructcost,
+                self.null_to_default(row.RELATED_BUILDING_PERMIT, ''),
+                row.acalink,
+                row.aalink,
+                self.pd_date(row.date_opened),
+                self.pd_date(row.date_closed),
+                self.pd_date(row.BOS_1ST_READ),
+                self.pd_date(row.BOS_2ND_READ),
+                self.pd_date(row.COM_HEARING),
+                self.pd_date(row.MAYORAL_SIGN),
+                self.pd_date(row.TRANSMIT_DATE_BOS),
+                self.pd_date(row.COM_HEARING_DATE_BOS),
+                self.null_to_default(row.MCD_REFERRAL, None),
+                self.null_to_default(row.ENVIRONMENTAL_REVIEW_TYPE, None),
+                source_hash,
+            )
+            batch.records.append(record)
+        batch.project_descriptions.extend(
+            transform.assign(parsed.project_descriptions, pks))
+        batch.dwelling_types.extend(
+            transform.assign(parsed.dwelling_types, pks))
+        batch.project_features.extend(
+            transform.assign(parsed.project_features, pks))
+        batch.land_uses.extend(transform.assign(parsed.land_uses, pks))
+        return pks
+
+    def end_batch(self, batch, rows, pending):
+        """Queues batch to be written, noting where it leaves the import."""
+        batch.rows = rows
+        batch.location_counter = self._location_counter
+        batch.record_counter = self._record_counter
+        #waiting on the writer thread
+        with self.stats.stage('queue batch'):
+            pending.put(batch)
+
+    def load_shadow(self, options):
+        """Runs the import in a shadow database and swaps it in for the
+        live one."""
+        if options['incremental']:
+            raise CommandError(
+                "--shadow loads the whole file, it can't be --incremental.")
+        shadow.check(connection, allow_file_swap=options['allow_file_swap'])
+        shadow.prepare(connection, resume=options['resume'])
+        with shadow.redirected(connection):
+            if options['resume'] and shadow.latest_import() is not None:
+                self.stdout.write(
+                    'The shadow import is complete, swapping it in')
+            else:
+                self.load(dict(options, shadow=False))
+        with self.stats.stage('swap'):
+            shadow.swap(connection)
+        cache.forget_version()
+
+    def load_snapshot(self, options):
+        """Loads a dumpppts snapshot rather than a CSV export."""
+        for option in ('quicktest', 'incremental', 'resume'):
+            if options[option]:
+                raise CommandError(
+                    '--%s can only be used with a CSV export' % option)
+        with self.stats.stage('restore snapshot'):
+            counts = snapshots.restore(options['filename'], self.writer)
+        for (model, count) in counts:
+            self.stats.count('%s rows' % model._meta.db_table, count)
+        self.rebuild_summaries()
+        with self.stats.stage('optimize search'):
+            search.optimize(connection)
+        #recorded as an import, so there's a new dataset version
+        DataImport.objects.create(
+            filename=options['filename'],
+            rows=dict(counts)[Record],
+            finished=timezone.now())
+        cache.forget_version()
+
+    def rebuild_summaries(self):
+        """Recomputes the rollup tables from what's now imported."""
+        with self.stats.stage('summaries'):
+            counts = summaries.rebuild()
+        for (model, count) in counts:
+            self.stats.count('%s rows' % model._meta.db_table, count)
+
+    def parse_chunks(self, chunks, workers):
+        """Runs transform.parse_chunk over chunks, yielding results in order.
+
+        With more than one worker the chunks are parsed in a process pool.
+        Everything that carries over from one chunk to the next (planners,
+        locations, ids, parent links) is handled by the caller as the results
+        come back in file order, so the output is the same as with one.
+        """
+        if workers <= 1:
+            for chunk in chunks:
+                parsed = transform.parse_chunk(chunk)
+                self.stats.merge(parsed.stats)
+                yield parsed
+            return
+        # fork, so the workers start with Django already set up. They never
+        # touch the database.
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers) as pool:
+            #don't read further ahead than the workers can use
+            pending = collections.deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(transform.parse_chunk, (chunk,)))
+                if len(pending) >= 2 * workers:
+                    yield self.parsed(pending.popleft())
+            while pending:
+                yield self.parsed(pending.popleft())
+
+    def parsed(self, result):
+        """The ParsedChunk of a worker's result, once it's ready. Its
+        stages took worker time, the wait for it is this process'."""
+        with self.stats.stage('wait for workers'):
+            parsed = result.get()
+        self.stats.merge(parsed.stats)
+        return parsed
+
+    def write_relations(self):
+        """Writes the parent/child links, once every record is in place."""
+        with self.stats.stage('resolve links'):
+            rel = self._links.resolve()
+        if self.incremental:
+            # Links between two unchanged records are already in the
+            # database. Checking for them, rather than only writing the
+            # links of records written this run, also puts back the links
+            # of records written by a run that stopped partway.
+            existing = set(Record.parent.through.objects.values_list(
+                *transform.RELATION_FIELDS).iterator())
+            rel = [r for r in rel if r not in existing]
+        self.write(Record.parent.through, transform.RELATION_FIELDS, rel)
+        self.stdout.write('%d parent/child links written, %d dangling' % (
+            len(rel), self._links.dangling))
+
+    def flush(self, batch):
+        """Writes out a batch of parsed rows.
+
+        The batch is written in one transaction along with the checkpoint,
+        so a run that dies leaves whole batches behind and knows which.
+        It runs in the WriteQueue's thread, which is profiled separately.
+        """
+        with self.stats.profiled(), transaction.atomic():
+            self.write_batch(batch)
+            with self.stats.stage('checkpoint'):
+                self.save_checkpoint(batch)
+
+    def write_batch(self, batch):
+        if self.incremental:
+            #changed records are replaced wholesale, children included
+            with self.stats.stage('delete records'):
+                self.delete_records(
+                    [r[0] for r in batch.records if r[0] in self._replaced])
+        self.write(RecordType, transform.RECORD_TYPE_FIELDS, batch.record_types)
+        self.write(Planner, transform.PLANNER_FIELDS, batch.planners)
+        self.write(Location, transform.LOCATION_FIELDS, batch.locations)
+        self.write(Record, transform.RECORD_FIELDS, batch.records)
+        self.write(
+            Record.project_description.through,
+            transform.PROJECT_DESCRIPTION_FIELDS,
+            batch.project_descriptions)
+        self.write(
+            DwellingType, transform.DWELLING_TYPE_FIELDS, batch.dwelling_types)
+        self.write(
+            ProjectFeature, transform.PROJECT_FEATURE_FIELDS,
+            batch.project_features)
+        self.write(LandUse, transform.LAND_USE_FIELDS, batch.land_uses)
+
+    def write(self, model, fields, rows):
+        """Writes rows to model's table, timed and counted per table."""
+        table = model._meta.db_table
+        with self.stats.stage('write %s' % table):
+            self.writer.write(model, fields, rows)
+        self.stats.count('%s rows' % table, len(rows))
+
+
+class Batch():
+    """Rows parsed since the last flush, waiting to be written."""
+    def __init__(self):
+        self.records = []
+        self.record_types = []
+        self.planners = []
+        self.locations = []
+        #records and child rows are tuples, see ppts.transform
+        self.project_descriptions = []
+        self.dwelling_types = []
+        self.project_features = []
+        self.land_uses = []
+        #for the checkpoint: input rows up to the end of the batch, and the
+        #id counters at that point
+        self.rows = 0
+        self.location_counter = 0
+        self.record_counter = 0
+
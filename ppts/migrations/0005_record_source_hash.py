@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppts', '0004_auto_20190517_1551'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='source_hash',
+            field=models.CharField(blank=True, help_text='Digest of the source row. loadppts --incremental uses this to find records that changed since the last load.', max_length=32),
+        ),
+    ]
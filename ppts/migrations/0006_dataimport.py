@@ -0,0 +1,27 @@
+# Generated by Django 2.2.28 on 2026-10-18 08:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppts', '0005_record_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataImport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=250)),
+                ('file_hash', models.CharField(blank=True, help_text='md5 of the input file, empty when it was read from stdin', max_length=32)),
+                ('incremental', models.BooleanField(default=False)),
+                ('started', models.DateTimeField(auto_now_add=True)),
+                ('finished', models.DateTimeField(help_text="When the import completed, null if it didn't (yet)", null=True)),
+                ('rows', models.IntegerField(default=0, help_text='Rows of the input committed so far')),
+                ('location_counter', models.IntegerField(default=0, help_text='Next Location id')),
+                ('record_counter', models.IntegerField(default=0, help_text='Next Record id')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppts', '0006_dataimport'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=100)),
+                ('year', models.IntegerField(help_text='Year the records were opened', null=True)),
+                ('records', models.IntegerField()),
+                ('net_units', models.DecimalField(decimal_places=2, help_text='Net change in dwelling units, market rate and affordable', max_digits=15)),
+                ('net_affordable_units', models.DecimalField(decimal_places=2, help_text='Net change in affordable dwelling units', max_digits=15)),
+                ('record_type', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='ppts.RecordType')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProjectDescriptionSummary',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=100)),
+                ('year', models.IntegerField(help_text='Year the records were opened', null=True)),
+                ('records', models.IntegerField()),
+                ('net_units', models.DecimalField(decimal_places=2, help_text='Net change in dwelling units, market rate and affordable', max_digits=15)),
+                ('net_affordable_units', models.DecimalField(decimal_places=2, help_text='Net change in affordable dwelling units', max_digits=15)),
+                ('project_description', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ppts.ProjectDescription')),
+            ],
+        ),
+    ]
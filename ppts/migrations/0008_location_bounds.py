@@ -0,0 +1,199 @@
+# Generated by Django 2.2.28 on 2026-10-18 09:50
+
+import re
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+BOUNDS = ('min_lon', 'min_lat', 'max_lon', 'max_lat', 'centroid_lon',
+          'centroid_lat')
+
+# ppts.spatial queries these. Note that on SQLite, a later migration that
+# remakes ppts_location (most AlterFields do) drops the triggers with it,
+# and has to create them again.
+SQLITE_RTREE = [
+    'CREATE VIRTUAL TABLE ppts_location_rtree USING rtree('
+    'id, min_lon, max_lon, min_lat, max_lat)',
+    'INSERT INTO ppts_location_rtree '
+    'SELECT id, min_lon, max_lon, min_lat, max_lat FROM ppts_location '
+    'WHERE min_lon IS NOT NULL',
+    'CREATE TRIGGER ppts_location_rtree_insert AFTER INSERT ON ppts_location '
+    'WHEN new.min_lon IS NOT NULL BEGIN '
+    'INSERT INTO ppts_location_rtree VALUES '
+    '(new.id, new.min_lon, new.max_lon, new.min_lat, new.max_lat); END',
+    'CREATE TRIGGER ppts_location_rtree_update AFTER UPDATE OF '
+    'id, min_lon, max_lon, min_lat, max_lat ON ppts_location BEGIN '
+    'DELETE FROM ppts_location_rtree WHERE id = old.id; '
+    'INSERT INTO ppts_location_rtree SELECT '
+    'new.id, new.min_lon, new.max_lon, new.min_lat, new.max_lat '
+    'WHERE new.min_lon IS NOT NULL; END',
+    'CREATE TRIGGER ppts_location_rtree_delete AFTER DELETE ON ppts_location '
+    'BEGIN DELETE FROM ppts_location_rtree WHERE id = old.id; END',
+]
+SQLITE_RTREE_DROP = [
+    'DROP TRIGGER IF EXISTS ppts_location_rtree_insert',
+    'DROP TRIGGER IF EXISTS ppts_location_rtree_update',
+    'DROP TRIGGER IF EXISTS ppts_location_rtree_delete',
+    'DROP TABLE IF EXISTS ppts_location_rtree',
+]
+POSTGRESQL_GIST = [
+    'CREATE INDEX ppts_location_bbox_gist ON ppts_location USING gist ('
+    'box(point(min_lon, min_lat), point(max_lon, max_lat)))',
+]
+POSTGRESQL_GIST_DROP = ['DROP INDEX IF EXISTS ppts_location_bbox_gist']
+
+
+# a ring of a WKT polygon, and the brackets opening it: "((" starts a
+# polygon's outer ring, "(" one of its holes
+WKT_RING = re.compile(r'(\(+)([^()]*)\)')
+
+
+def geometry_bounds(geom):
+    """The bounding box and centroid of a WKT (multi)polygon.
+
+    A copy of ppts.transform.geometry_bounds as this migration was
+    written, so that changes to that one don't change what it does.
+
+    Returns (min_lon, min_lat, max_lon, max_lat, centroid_lon,
+    centroid_lat), all None if geom has no coordinates. The centroid is
+    area weighted, holes taken out; for a polygon with no area it's the
+    middle of the bounding box. Coordinates are taken as planar, which is
+    close enough for a parcel.
+    """
+    if not geom:
+        return (None,) * 6
+    lons = []
+    lats = []
+    area = centroid_lon = centroid_lat = 0.0
+    for match in WKT_RING.finditer(str(geom)):
+        values = list(map(float, match.group(2).replace(',', ' ').split()))
+        x = values[0::2]
+        y = values[1::2]
+        if not x:
+            continue
+        lons.extend((min(x), max(x)))
+        lats.extend((min(y), max(y)))
+        # shoelace formula
+        twice_area = sum_x = sum_y = 0.0
+        x0, y0 = x[-1], y[-1]
+        for (x1, y1) in zip(x, y):
+            cross = x0 * y1 - x1 * y0
+            twice_area += cross
+            sum_x += (x0 + x1) * cross
+            sum_y += (y0 + y1) * cross
+            x0, y0 = x1, y1
+        if not twice_area:
+            continue
+        weight = abs(twice_area)
+        if len(match.group(1)) == 1:
+            weight = -weight
+        centroid_lon += weight * sum_x / (3 * twice_area)
+        centroid_lat += weight * sum_y / (3 * twice_area)
+        area += weight
+    if not lons:
+        return (None,) * 6
+    bounds = (min(lons), min(lats), max(lons), max(lats))
+    if area:
+        return bounds + (centroid_lon / area, centroid_lat / area)
+    return bounds + ((bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2)
+
+
+def fill_bounds(apps, schema_editor):
+    """Works out the new columns for the Locations already imported."""
+    Location = apps.get_model('ppts', 'Location')
+    connection = schema_editor.connection
+    sql = 'UPDATE ppts_location SET %s WHERE id = %%s' % ', '.join(
+        '%s = %%s' % name for name in BOUNDS)
+    batch = []
+    with connection.cursor() as cursor:
+        for (pk, geom) in Location.objects.values_list(
+                'id', 'the_geom').iterator():
+            batch.append(geometry_bounds(geom) + (pk,))
+            if len(batch) >= 2000:
+                cursor.executemany(sql, batch)
+                batch = []
+        cursor.executemany(sql, batch)
+
+
+def run(statements):
+    def run_statements(apps, schema_editor):
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run_statements
+
+
+def create_rtree(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run(POSTGRESQL_GIST)(apps, schema_editor)
+    elif vendor == 'sqlite':
+        try:
+            run(SQLITE_RTREE[:1])(apps, schema_editor)
+        except OperationalError:
+            # SQLite built without the R*Tree module, ppts.spatial makes do
+            # with the plain indexes
+            return
+        run(SQLITE_RTREE[1:])(apps, schema_editor)
+
+
+def drop_rtree(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run(POSTGRESQL_GIST_DROP)(apps, schema_editor)
+    elif vendor == 'sqlite':
+        run(SQLITE_RTREE_DROP)(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppts', '0007_summaries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='centroid_lat',
+            field=models.FloatField(help_text="Latitude of the polygon's centroid", null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='centroid_lon',
+            field=models.FloatField(help_text="Longitude of the polygon's centroid", null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='max_lat',
+            field=models.FloatField(help_text="North edge of the polygon's bounding box", null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='max_lon',
+            field=models.FloatField(help_text="East edge of the polygon's bounding box", null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='min_lat',
+            field=models.FloatField(help_text="South edge of the polygon's bounding box", null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='min_lon',
+            field=models.FloatField(help_text="West edge of the polygon's bounding box", null=True),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='the_geom',
+            field=models.TextField(help_text='Polygon defining the parcel, as WKT.'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['min_lon', 'max_lon', 'min_lat', 'max_lat'], name='ppts_location_bbox'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['centroid_lon', 'centroid_lat'], name='ppts_location_centroid'),
+        ),
+        migrations.RunPython(fill_bounds, migrations.RunPython.noop),
+        migrations.RunPython(create_rtree, drop_rtree),
+    ]
@@ -0,0 +1,105 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# ppts.search queries these. The name counts for more than the description
+# in the ranking. Like the R*Tree triggers in 0008, on SQLite a later
+# migration that remakes ppts_record drops the triggers, and has to create
+# them again.
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE ppts_record_fts USING fts5("
+    "name, description, content='ppts_record', content_rowid='id', "
+    "tokenize='porter unicode61')",
+    "INSERT INTO ppts_record_fts(ppts_record_fts) VALUES ('rebuild')",
+    'CREATE TRIGGER ppts_record_fts_insert AFTER INSERT ON ppts_record BEGIN '
+    'INSERT INTO ppts_record_fts(rowid, name, description) VALUES '
+    '(new.id, new.name, new.description); END',
+    'CREATE TRIGGER ppts_record_fts_update AFTER UPDATE OF '
+    'id, name, description ON ppts_record BEGIN '
+    "INSERT INTO ppts_record_fts(ppts_record_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    'INSERT INTO ppts_record_fts(rowid, name, description) VALUES '
+    '(new.id, new.name, new.description); END',
+    'CREATE TRIGGER ppts_record_fts_delete AFTER DELETE ON ppts_record BEGIN '
+    "INSERT INTO ppts_record_fts(ppts_record_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+]
+SQLITE_FTS_DROP = [
+    'DROP TRIGGER IF EXISTS ppts_record_fts_insert',
+    'DROP TRIGGER IF EXISTS ppts_record_fts_update',
+    'DROP TRIGGER IF EXISTS ppts_record_fts_delete',
+    'DROP TABLE IF EXISTS ppts_record_fts',
+]
+# A generated column, so every way a record is written (loadppts' COPY,
+# the admin, snapshots) keeps it up to date. It isn't on the model.
+# Generated columns are new in PostgreSQL 12.
+POSTGRESQL_GENERATED_VERSION = 120000
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(%(row)sname, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(%(row)sdescription, '')), "
+    "'B')")
+POSTGRESQL_TSVECTOR = [
+    'ALTER TABLE ppts_record ADD COLUMN search tsvector GENERATED ALWAYS AS '
+    '(%s) STORED' % (SEARCH_VECTOR % {'row': ''}),
+    'CREATE INDEX ppts_record_search ON ppts_record USING gin (search)',
+]
+# Before 12, a plain column that a trigger keeps up to date instead (it
+# fires on COPY too)
+POSTGRESQL_TSVECTOR_TRIGGER = [
+    'ALTER TABLE ppts_record ADD COLUMN search tsvector',
+    'UPDATE ppts_record SET search = %s' % (SEARCH_VECTOR % {'row': ''}),
+    'CREATE FUNCTION ppts_record_search() RETURNS trigger AS $$ BEGIN '
+    'NEW.search := %s; RETURN NEW; END $$ LANGUAGE plpgsql'
+    % (SEARCH_VECTOR % {'row': 'NEW.'}),
+    'CREATE TRIGGER ppts_record_search BEFORE INSERT OR UPDATE OF '
+    'name, description ON ppts_record '
+    'FOR EACH ROW EXECUTE PROCEDURE ppts_record_search()',
+    'CREATE INDEX ppts_record_search ON ppts_record USING gin (search)',
+]
+POSTGRESQL_TSVECTOR_DROP = [
+    'DROP INDEX IF EXISTS ppts_record_search',
+    'DROP TRIGGER IF EXISTS ppts_record_search ON ppts_record',
+    'DROP FUNCTION IF EXISTS ppts_record_search()',
+    'ALTER TABLE ppts_record DROP COLUMN IF EXISTS search',
+]
+
+
+def run(statements):
+    def run_statements(apps, schema_editor):
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run_statements
+
+
+def create_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        if schema_editor.connection.pg_version >= POSTGRESQL_GENERATED_VERSION:
+            run(POSTGRESQL_TSVECTOR)(apps, schema_editor)
+        else:
+            run(POSTGRESQL_TSVECTOR_TRIGGER)(apps, schema_editor)
+    elif vendor == 'sqlite':
+        try:
+            run(SQLITE_FTS[:1])(apps, schema_editor)
+        except OperationalError:
+            # SQLite built without FTS5, ppts.search falls back to LIKE
+            return
+        run(SQLITE_FTS[1:])(apps, schema_editor)
+
+
+def drop_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        run(POSTGRESQL_TSVECTOR_DROP)(apps, schema_editor)
+    elif vendor == 'sqlite':
+        run(SQLITE_FTS_DROP)(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppts', '0008_location_bounds'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppts', '0009_record_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['status', 'id'], name='ppts_record_status'),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['record_type', 'id'], name='ppts_record_type'),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['date_opened'], name='ppts_record_opened'),
+        ),
+        migrations.AddIndex(
+            model_name='record',
+            index=models.Index(fields=['record_id'], name='ppts_record_record_id'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+# The admin searches locations by the start of their address, as
+# UPPER(address) LIKE UPPER('...%'). Django 2.2 can't declare an index on an
+# expression, and SQLite's LIKE can't use one anyway.
+POSTGRESQL_INDEX = [
+    'CREATE INDEX ppts_location_address_upper ON ppts_location '
+    '(UPPER(address) text_pattern_ops)',
+]
+POSTGRESQL_INDEX_DROP = ['DROP INDEX IF EXISTS ppts_location_address_upper']
+
+
+def run(statements):
+    def run_statements(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for sql in statements:
+                schema_editor.execute(sql)
+    return run_statements
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ppts', '0010_record_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run(POSTGRESQL_INDEX), run(POSTGRESQL_INDEX_DROP)),
+    ]
@@ -2,9 +2,15 @@ from django.db import models
 
 
 class Location(models.Model):
+    """A parcel.
+
+    The polygon is kept as WKT text. Its bounding box and centroid are
+    worked out by loadppts and stored alongside it, for the spatial queries
+    in ppts.spatial.
+    """
     id = models.IntegerField(help_text="Primary Key", primary_key=True)
     the_geom = models.TextField(
-        help_text="Polygon defining the parcel.")  # TODO: GIS support
+        help_text="Polygon defining the parcel, as WKT.")
     shape_length = models.DecimalField(
         max_digits=15,
         decimal_places=8,
@@ -20,6 +26,37 @@ class Location(models.Model):
         help_text=("An address for this location. The format of these is "
                    "extremely inconsistent, and sometimes a single parcel "
                    "actually has two addresses."))
+    min_lon = models.FloatField(
+        help_text="West edge of the polygon's bounding box",
+        null=True)
+    min_lat = models.FloatField(
+        help_text="South edge of the polygon's bounding box",
+        null=True)
+    max_lon = models.FloatField(
+        help_text="East edge of the polygon's bounding box",
+        null=True)
+    max_lat = models.FloatField(
+        help_text="North edge of the polygon's bounding box",
+        null=True)
+    centroid_lon = models.FloatField(
+        help_text="Longitude of the polygon's centroid",
+        null=True)
+    centroid_lat = models.FloatField(
+        help_text="Latitude of the polygon's centroid",
+        null=True)
+
+    class Meta:
+        # The bounding boxes also get a database R-tree where there is one,
+        # see migration 0008 and ppts.spatial
+        indexes = [
+            models.Index(fields=['min_lon', 'max_lon', 'min_lat', 'max_lat'],
+                         name='ppts_location_bbox'),
+            models.Index(fields=['centroid_lon', 'centroid_lat'],
+                         name='ppts_location_centroid'),
+        ]
+
+    def __str__(self):
+        return self.address or str(self.id)
 
 
 class Planner(models.Model):
@@ -31,6 +68,9 @@ class Planner(models.Model):
     email = models.CharField(max_length=100)
     phone = models.CharField(max_length=100)
 
+    def __str__(self):
+        return self.name
+
 
 class RecordType(models.Model):
     category = models.CharField(
@@ -59,6 +99,9 @@ class RecordType(models.Model):
         help_text=("City department that owns the record. In this data, "
                    "always \"planning\"."))
 
+    def __str__(self):
+        return self.category
+
 
 class ProjectDescription(models.Model):
     """Project Description
@@ -205,6 +248,27 @@ class Record(models.Model):
         help_text="Committee Hearing Date - BOS Review",
         null=True)
 
+    source_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        help_text=("Digest of the source row. loadppts --incremental uses "
+                   "this to find records that changed since the last load."))
+
+    class Meta:
+        # Chosen with benchmarks/queries.py on a million records. The API
+        # pages in id order, so its filters are (value, id) to read a page
+        # straight off the index however rare the value.
+        indexes = [
+            models.Index(fields=['status', 'id'], name='ppts_record_status'),
+            models.Index(fields=['record_type', 'id'],
+                         name='ppts_record_type'),
+            models.Index(fields=['date_opened'], name='ppts_record_opened'),
+            models.Index(fields=['record_id'], name='ppts_record_record_id'),
+        ]
+
+    def __str__(self):
+        return self.record_id
+
 
 class LandUse(models.Model):
     RC = "RC"
@@ -358,3 +422,76 @@ class DwellingType(models.Model):
         help_text="Area (optional)",
         blank=True,
         null=True)
+
+
+class DataImport(models.Model):
+    """One run of loadppts.
+
+    Every batch loadppts writes updates its row in the same transaction, so
+    it always says how far the run got. An import that stopped partway can
+    be picked up from there with loadppts --resume.
+    """
+    filename = models.CharField(max_length=250)
+    file_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        help_text="md5 of the input file, empty when it was read from stdin")
+    incremental = models.BooleanField(default=False)
+    started = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(
+        help_text="When the import completed, null if it didn't (yet)",
+        null=True)
+    rows = models.IntegerField(
+        default=0,
+        help_text="Rows of the input committed so far")
+    location_counter = models.IntegerField(
+        default=0,
+        help_text="Next Location id")
+    record_counter = models.IntegerField(
+        default=0,
+        help_text="Next Record id")
+
+
+class RecordSummary(models.Model):
+    """Records and their dwelling units, per record type, status and the
+    year they were opened.
+
+    A rollup for the dashboards, so they read a few hundred rows rather
+    than aggregating every Record. loadppts rebuilds it at the end of each
+    import, see ppts.summaries.
+    """
+    record_type = models.ForeignKey(
+        RecordType, on_delete=models.SET_NULL, null=True)
+    status = models.CharField(max_length=100)
+    year = models.IntegerField(
+        help_text="Year the records were opened",
+        null=True)
+    records = models.IntegerField()
+    net_units = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        help_text="Net change in dwelling units, market rate and affordable")
+    net_affordable_units = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        help_text="Net change in affordable dwelling units")
+
+
+class ProjectDescriptionSummary(models.Model):
+    """As RecordSummary, per project description checkbox rather than
+    record type. Records with several checkboxes count towards each."""
+    project_description = models.ForeignKey(
+        ProjectDescription, on_delete=models.CASCADE)
+    status = models.CharField(max_length=100)
+    year = models.IntegerField(
+        help_text="Year the records were opened",
+        null=True)
+    records = models.IntegerField()
+    net_units = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        help_text="Net change in dwelling units, market rate and affordable")
+    net_affordable_units = models.DecimalField(
+        max_digits=15,
+        decimal_places=2,
+        help_text="Net change in affordable dwelling units")
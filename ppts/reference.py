@@ -0,0 +1,129 @@
+"""Row-at-a-time versions of the transforms in ppts.transform.
+
+loadppts used to build a record's child rows one CSV row at a time with
+these. It uses the column-wise functions in ppts.transform now, and these
+are kept only as the reference those are tested (ppts.tests.TransformTests)
+and timed (benchmarks.transform) against. Nothing in the import calls them.
+"""
+import hashlib
+
+import pandas as pd
+
+from ppts.models import DwellingType
+from ppts.models import LandUse
+from ppts.models import ProjectDescription
+from ppts.models import ProjectFeature
+from ppts.models import Record
+
+
+def null_to_default(d, default):
+    if pd.isnull(d):
+        return default
+    return d
+
+
+def hash_value(v):
+    # Normalize so the digest doesn't depend on the dtype pandas happens
+    # to infer for a chunk (e.g. 5 vs 5.0 when a column has gaps)
+    if pd.isnull(v):
+        return ''
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    if isinstance(v, pd.Timestamp):
+        return v.isoformat()
+    return str(v)
+
+
+def row_hash(row):
+    """Digest of a row's source values, stored on Record.source_hash."""
+    # row[0] is the dataframe index, which depends on the row position
+    values = [hash_value(v) for v in row[1:]]
+    return hashlib.md5('\x1f'.join(values).encode('utf-8')).hexdigest()
+
+
+def project_descriptions(row):
+    """The ProjectDescription types that apply to a row."""
+    # The choices on ProjectDescription are the column names in the
+    # original data
+    pds = []
+    for (col, _ignore) in ProjectDescription.CHOICES:
+        checked = getattr(row, col, False)
+        if checked and not pd.isnull(checked):
+            if (isinstance(checked, str) and
+                    checked.lower() == "unchecked" and
+                    checked.lower() == "no"):
+                continue
+            pds.append(col)
+    return pds
+
+
+def dwelling_type(row, record):
+    prefix = "RESIDENTIAL"
+    dts = []
+    for (infix, _ignore) in DwellingType.CHOICES:
+        exist = null_to_default(getattr(row, "_".join([prefix, infix, "EXIST"]), 0), 0)
+        prop = null_to_default(getattr(row, "_".join([prefix, infix, "PROP"]), 0), 0)
+        net = null_to_default(getattr(row, "_".join([prefix, infix, "NET"]), 0), 0)
+        area = null_to_default(getattr(row, "_".join([prefix, infix, "AREA"]), 0), 0)
+        if any([exist, prop, net, area]):
+            dts.append(DwellingType(
+                record=record,
+                type=infix,
+                exist=exist,
+                proposed=prop,
+                net=net,
+                area=area))
+    return dts
+
+
+def project_feature(row, record):
+    prefix = "PRJ_FEATURE"
+    pfs = []
+    for (infix, _ignore) in ProjectFeature.CHOICES:
+        other_name = ""
+        if infix == ProjectFeature.OTHER:
+            other_name = null_to_default(getattr(row, "_".join([prefix, infix]), ""), "")
+        exist = null_to_default(getattr(row, "_".join([prefix, infix, "EXIST"]), 0), 0)
+        #prop = null_to_default(getattr(row, "_".join([prefix, infix, "PROP"]), 0), 0)
+        net = null_to_default(getattr(row, "_".join([prefix, infix, "NET"]), 0), 0)
+        #if any([exist, prop, net, other_name]):
+        if any([exist, net, other_name]):
+            pfs.append(ProjectFeature(
+                record=record,
+                type=infix,
+                other_name=other_name,
+                exist=exist,
+                #proposed=prop,
+                proposed = exist+net,
+                net=net))
+    return pfs
+
+
+def land_use(row, record):
+    prefix = "LAND_USE"
+    lus = []
+    for (infix, _ignore) in LandUse.CHOICES:
+        exist = null_to_default(getattr(row, "_".join([prefix, infix, "EXIST"]), 0), 0)
+        prop = null_to_default(getattr(row, "_".join([prefix, infix, "PROP"]), 0), 0)
+        net = null_to_default(getattr(row, "_".join([prefix, infix, "NET"]), 0), 0)
+        if any([exist, prop, net]):
+            lus.append(LandUse(
+                record=record,
+                type=infix,
+                exist=exist,
+                proposed=prop,
+                net=net))
+    return lus
+
+
+def transform(chunk, record_ids):
+    """Everything above for every row of a chunk, in one list."""
+    out = []
+    for (pk, row) in zip(record_ids, chunk.itertuples()):
+        record = Record(id=pk)
+        out.append(row_hash(row))
+        out.append(project_descriptions(row))
+        out.extend(dwelling_type(row, record))
+        out.extend(project_feature(row, record))
+        out.extend(land_use(row, record))
+    return out
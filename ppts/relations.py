@@ -0,0 +1,69 @@
+"""Resolution of the parent/child links between records.
+
+Each row of the PPTS export lists the record_ids of its parents and of its
+children, comma separated. A link is only kept when both ends agree: the
+child lists the parent, and the parent lists the child.
+
+While the file is read, RecordLinks just collects what every row claims,
+keyed by the claiming row's primary key on one side and a record_id string
+on the other. Once every record has a primary key, resolve() turns the
+record_ids into keys and matches both sides with one join, so the result
+doesn't depend on which rows were read or written together.
+"""
+import pandas as pd
+
+
+class RecordLinks():
+    def __init__(self):
+        # record_id -> primary key, as parallel lists
+        self.record_ids = []
+        self.pks = []
+        # (child pk, parent record_id) from the "parent" column
+        self.child_pks = []
+        self.parent_record_ids = []
+        # (parent pk, child record_id) from the "children" column
+        self.parent_pks = []
+        self.child_record_ids = []
+        self.dangling = 0
+
+    def add(self, pk, record_id, parents, children):
+        """Collects the links listed by one row."""
+        self.record_ids.append(record_id)
+        self.pks.append(pk)
+        if not pd.isnull(parents):
+            for parent in parents.split(','):
+                self.child_pks.append(pk)
+                self.parent_record_ids.append(parent)
+        if not pd.isnull(children):
+            for child in children.split(','):
+                self.parent_pks.append(pk)
+                self.child_record_ids.append(child)
+
+    def resolve(self):
+        """Returns (child pk, parent pk) for every link both ends agree on.
+
+        Links listed by only one end, or pointing at a record_id that isn't
+        in the data, are counted in self.dangling.
+        """
+        ids = pd.DataFrame({'record_id': self.record_ids, 'pk': self.pks})
+        ids = ids.drop_duplicates('record_id', keep='last')
+        claimed = pd.DataFrame({
+            'child': self.child_pks,
+            'record_id': self.parent_record_ids,
+        }).merge(ids, on='record_id').rename(columns={'pk': 'parent'})
+        listed = pd.DataFrame({
+            'parent': self.parent_pks,
+            'record_id': self.child_record_ids,
+        }).merge(ids, on='record_id').rename(columns={'pk': 'child'})
+        links = pd.merge(
+            claimed[['child', 'parent']].drop_duplicates(),
+            listed[['child', 'parent']].drop_duplicates(),
+            how='outer', indicator=True)
+        links = links[links.child != links.parent]
+        found = links[links._merge == 'both']
+        found = found.sort_values(['child', 'parent'])
+        unresolved = (len(self.parent_record_ids) - len(claimed) +
+                      len(self.child_record_ids) - len(listed))
+        self.dangling = unresolved + len(links) - len(found)
+        return list(zip(found.child.astype(int).tolist(),
+                        found.parent.astype(int).tolist()))
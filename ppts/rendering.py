@@ -0,0 +1,99 @@
+"""Encoding the graphs' figures for the graph views.
+
+Graphs are plain matplotlib Figures, made without pyplot, so nothing keeps
+a reference to them once they're rendered (pyplot keeps every figure it
+makes until it's closed). render() has the figure save itself straight into
+the response's bytes, in one of FORMATS:
+
+    /graphs/sample_1?format=svg&dpi=150&width=1200&height=900
+
+Without ?format the format comes from the Accept header, PNG if it doesn't
+name any of them. width and height are in pixels.
+"""
+import io
+
+# in order of preference, when a client accepts several equally
+FORMATS = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'svg': 'image/svg+xml',
+}
+DEFAULTS = {'format': 'png', 'dpi': 100, 'width': 640, 'height': 480}
+# (min, max) of the numeric options
+LIMITS = {'dpi': (20, 300), 'width': (100, 2400), 'height': (100, 2400)}
+
+
+def accepted(accept):
+    """Returns (q, media type) for each media range in an Accept header."""
+    ranges = []
+    for media_range in accept.split(','):
+        media_type, *params = [p.strip() for p in media_range.split(';')]
+        if not media_type:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges.append((q, media_type.lower()))
+    return ranges
+
+
+def negotiate(accept):
+    """The format to answer a request with this Accept header in."""
+    ranges = accepted(accept)
+    best = None
+    for (preference, (format, content_type)) in enumerate(FORMATS.items()):
+        # how specifically each range matches: exactly, image/* or */*
+        specificity = {
+            content_type: 2, content_type.split('/')[0] + '/*': 1, '*/*': 0}
+        matches = [(specificity[media_type], q)
+                   for (q, media_type) in ranges if media_type in specificity]
+        if not matches:
+            continue
+        # the most specific range sets the quality, and a type the client
+        # names beats one it only accepts through a wildcard
+        most_specific, q = max(matches)
+        if q > 0:
+            rank = (q, most_specific == 2, -preference)
+            if best is None or rank > best[0]:
+                best = (rank, format)
+    return best[1] if best else DEFAULTS['format']
+
+
+def options(request):
+    """The rendering options of a graph request, see render().
+
+    Raises ValueError for options that aren't valid.
+    """
+    result = dict(DEFAULTS)
+    format = request.GET.get('format')
+    if format is not None:
+        if format not in FORMATS:
+            raise ValueError('format must be one of %s' % ', '.join(FORMATS))
+        result['format'] = format
+    else:
+        result['format'] = negotiate(request.META.get('HTTP_ACCEPT', ''))
+    for (name, (low, high)) in LIMITS.items():
+        value = request.GET.get(name)
+        if value is None:
+            continue
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError('%s must be a whole number' % name)
+        if not low <= value <= high:
+            raise ValueError('%s must be between %d and %d' % (name, low, high))
+        result[name] = value
+    return result
+
+
+def render(figure, format='png', dpi=100, width=640, height=480):
+    """Returns a figure encoded as format, at width x height pixels."""
+    figure.set_size_inches(width / dpi, height / dpi)
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format=format, dpi=dpi)
+    return buffer.getvalue()
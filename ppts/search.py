@@ -0,0 +1,114 @@
+"""Full text search over Record names and descriptions.
+
+Migration 0009 indexes them with the database's own full text search:
+
+- PostgreSQL: ppts_record.search, a tsvector of the name and
+  description, with a GIN index. It's a generated column on PostgreSQL
+  12 or later, and kept up to date by a trigger on older versions.
+- SQLite: ppts_record_fts, an FTS5 table over ppts_record kept up to date
+  by triggers on it.
+
+Either way the index is written along with the records, by loadppts or
+the admin; loadppts then calls optimize(), as a bulk load leaves it slow.
+English words are stemmed on both, so "building" finds "buildings", and a
+record has to match every word searched for. Matches in the name rank
+above ones in the description. Anywhere else, searches fall back to LIKE
+on each word, unranked.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+
+from ppts.models import Record
+from ppts import sql
+
+FTS_TABLE = 'ppts_record_fts'
+# name, description
+FTS_WEIGHTS = (4.0, 1.0)
+
+
+def words(query):
+    """The words in a search: letters and digits, the rest is ignored."""
+    return re.findall(r'\w+', query)
+
+
+def has_fts(connection):
+    """Whether the database has the FTS5 table (SQLite can be built
+    without FTS5, in which case the migration skips it)."""
+    return sql.has_table(connection, FTS_TABLE)
+
+
+def optimize(connection):
+    """Tidies up the index after a bulk load.
+
+    PostgreSQL queues new GIN entries in a pending list, which every search
+    reads through until a vacuum merges it (14 ms rather than 0.2 ms a
+    search, after loading 30,000 records). FTS5 merges the b-trees it wrote
+    in pieces.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT gin_clean_pending_list('ppts_record_search'::regclass)")
+        elif connection.vendor == 'sqlite' and has_fts(connection):
+            cursor.execute(
+                "INSERT INTO %s(%s) VALUES ('optimize')" % (FTS_TABLE,
+                                                          FTS_TABLE))
+
+
+def ranked_sql(connection, terms):
+    """SQL and params selecting (id, rank) of the records matching terms,
+    best first, or None without a full text index."""
+    if connection.vendor == 'postgresql':
+        return (
+            "SELECT id, ts_rank(search, query) AS rank "
+            "FROM ppts_record, plainto_tsquery('english', %s) query "
+            "WHERE search @@ query", [' '.join(terms)])
+    if connection.vendor == 'sqlite' and has_fts(connection):
+        # each word quoted, so none is taken as FTS5 syntax (NOT, NEAR...)
+        return (
+            'SELECT rowid AS id, -bm25(%s, %s) AS rank FROM %s '
+            'WHERE %s MATCH %%s' % (
+                FTS_TABLE, ', '.join(map(str, FTS_WEIGHTS)), FTS_TABLE,
+                FTS_TABLE),
+            [' '.join('"%s"' % term for term in terms)])
+    return None
+
+
+def like(records, terms):
+    for term in terms:
+        records = records.filter(
+            Q(name__icontains=term) | Q(description__icontains=term))
+    return records
+
+
+def matching(records, query):
+    """The records that match the search query, in no particular order."""
+    terms = words(query)
+    if not terms:
+        return records.none()
+    found = ranked_sql(connections[records.db], terms)
+    if found is None:
+        return like(records, terms)
+    return records.filter(id__in=sql.RawSubquery(
+        'SELECT id FROM (%s) matches' % found[0], found[1]))
+
+
+def ranked(query, limit, using='default'):
+    """The ids and ranks of the best limit records matching the search
+    query, best first."""
+    terms = words(query)
+    if not terms:
+        return []
+    connection = connections[using]
+    found = ranked_sql(connection, terms)
+    if found is None:
+        ids = like(Record.objects.using(using), terms).order_by(
+            'id').values_list('id', flat=True)[:limit]
+        return [(pk, 0.0) for pk in ids]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            '%s ORDER BY rank DESC, id LIMIT %%s' % found[0],
+            found[1] + [limit])
+        return cursor.fetchall()
@@ -0,0 +1,299 @@
+"""Loading a new dataset beside the live one, then swapping it in.
+
+    python manage.py loadppts ppts.csv --shadow
+
+runs an ordinary full import into a shadow database: on PostgreSQL the
+schema ppts_shadow of the same database, on SQLite a file next to the
+database, <name>.shadow. The shadow's tables are created as the migrations
+leave them, indexes included, then loaded and analyzed, while the site
+keeps reading the live tables, which the load never touches or locks.
+Then:
+
+- PostgreSQL: in one transaction, the live ppts tables move to the schema
+  ppts_old and the shadow's to the live schema (ALTER TABLE ... SET
+  SCHEMA, which only changes the catalog and takes its indexes,
+  constraints and sequences along), and the import is recorded in the live
+  DataImport table. Each query sees either the old tables or the new ones.
+  The swap needs a moment's exclusive lock on each table, so it waits at
+  most SWAP_LOCK_TIMEOUT for queries already running, then gives up and
+  tries again, rather than queueing every new query behind them.
+- SQLite: the live database's other tables (users, sessions, the import
+  history) are copied into the shadow file, under a write lock, and the
+  file renamed over the database. Connections opened after that read the
+  new file; queries under way finish reading the old one. But a
+  connection opened before the swap goes on using the old file, which
+  has been unlinked: a process with persistent connections (CONN_MAX_AGE)
+  serves the old dataset until it reconnects, and whatever it writes to
+  the other tables is lost. So the swap has to be asked for with
+  --allow-file-swap, once every such process is stopped or can't write.
+  WAL mode isn't supported: the old database's -wal file would be applied
+  to the new one.
+
+DataImport is the one ppts table that isn't swapped: it's the history of
+every import, and the dataset version (see ppts.cache) comes from it.
+If a shadow load stops partway, run it again with --resume; if only the
+swap failed, --resume just retries it.
+"""
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError
+from django.db import transaction
+from django.db.migrations import RunPython
+from django.db.migrations.loader import MigrationLoader
+
+from ppts.models import DataImport
+
+SHADOW_SCHEMA = 'ppts_shadow'
+OLD_SCHEMA = 'ppts_old'
+SHADOW_SUFFIX = '.shadow'
+SWAP_LOCK_TIMEOUT = '2s'
+SWAP_ATTEMPTS = 30
+# seconds between attempts, for the queries in the way to finish
+SWAP_PAUSE = 1
+
+
+def swapped_tables():
+    """The tables a shadow load replaces: every ppts table but the import
+    history, through tables included."""
+    return [
+        model._meta.db_table
+        for model in apps.get_app_config('ppts').get_models(
+            include_auto_created=True)
+        if model is not DataImport]
+
+
+def check(connection, allow_file_swap=False):
+    """Raises a CommandError if the database can't take a shadow load, or
+    if it's SQLite and the file swap isn't allowed."""
+    if connection.vendor == 'postgresql':
+        return
+    if connection.vendor != 'sqlite':
+        raise CommandError(
+            'Shadow loads need PostgreSQL or SQLite, not %s.'
+            % connection.vendor)
+    if connection.is_in_memory_db():
+        raise CommandError('Shadow loads need a database file.')
+    if not allow_file_swap:
+        raise CommandError(
+            'A shadow load on SQLite replaces the database file, and '
+            'whatever connections opened before the swap write to the '
+            'old one is lost (see ppts/shadow.py). Stop the site, or make '
+            'sure nothing writes, and run again with --allow-file-swap.')
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        if cursor.fetchone()[0] == 'wal':
+            raise CommandError(
+                "Shadow loads can't swap a SQLite database in WAL mode.")
+
+
+def shadow_path(connection):
+    return connection.settings_dict['NAME'] + SHADOW_SUFFIX
+
+
+def prepare(connection, resume=False):
+    """Creates the shadow database, migrated and empty, or with resume
+    keeps the one a previous shadow load left."""
+    if connection.vendor != 'postgresql':
+        if not resume:
+            drop(connection)
+        with redirected(connection):
+            call_command('migrate', database=connection.alias, verbosity=0,
+                         interactive=False)
+        return
+    if resume:
+        return
+    drop(connection)
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE SCHEMA %s' % SHADOW_SCHEMA)
+    with redirected(connection):
+        create_tables(connection)
+
+
+def create_tables(connection):
+    """Creates the ppts tables from the models, with what the migrations
+    add to them in SQL.
+
+    Not with migrate, as Django 2.2 looks up constraints in the public
+    schema whatever the search_path, and the migrations that alter
+    foreign keys drop them by name. The models make the tables, and the
+    migrations' RunPython operations (which don't introspect) add the
+    columns and indexes the models don't know about.
+    """
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    state = loader.project_state()
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('ppts').get_models():
+            editor.create_model(model)
+        for key in loader.graph.forwards_plan(
+                loader.graph.leaf_nodes('ppts')[0]):
+            if key[0] != 'ppts':
+                continue
+            for operation in loader.graph.nodes[key].operations:
+                if isinstance(operation, RunPython):
+                    operation.code(state.apps, editor)
+
+
+def drop(connection):
+    """Removes the shadow database and, on PostgreSQL, the tables of the
+    dataset it replaced."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for schema in (SHADOW_SCHEMA, OLD_SCHEMA):
+                cursor.execute('DROP SCHEMA IF EXISTS %s CASCADE' % schema)
+        return
+    for suffix in ('', '-journal'):
+        try:
+            os.remove(shadow_path(connection) + suffix)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def redirected(connection):
+    """Points connection at the shadow database until the block ends, so
+    everything that uses it (the ORM, ppts.writers, migrate) works on the
+    shadow instead."""
+    settings_dict = connection.settings_dict
+    saved = dict(settings_dict, OPTIONS=dict(settings_dict['OPTIONS']))
+    connection.close()
+    if connection.vendor == 'postgresql':
+        options = settings_dict['OPTIONS'].get('options', '')
+        settings_dict['OPTIONS'] = dict(
+            settings_dict['OPTIONS'],
+            options=(options + ' -c search_path=%s' % SHADOW_SCHEMA).strip())
+    else:
+        settings_dict['NAME'] = shadow_path(connection)
+    try:
+        yield
+    finally:
+        connection.close()
+        settings_dict.clear()
+        settings_dict.update(saved)
+
+
+def latest_import():
+    """The field values of the latest finished import, to record it in the
+    live database; None if there isn't one."""
+    fields = [field.attname for field in DataImport._meta.concrete_fields
+              if not field.primary_key]
+    return DataImport.objects.filter(finished__isnull=False).order_by(
+        '-id').values(*fields).first()
+
+
+def swap(connection):
+    """Replaces the live dataset with the shadow's, see the module
+    docstring, and drops the old one."""
+    with redirected(connection):
+        imported = latest_import()
+    if imported is None:
+        raise CommandError('The shadow database holds no finished import.')
+    if connection.vendor == 'postgresql':
+        swap_schemas(connection, imported)
+    else:
+        swap_files(connection, imported)
+    drop(connection)
+
+
+def swap_schemas(connection, imported):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT current_schema()')
+        live = cursor.fetchone()[0]
+        cursor.execute('DROP SCHEMA IF EXISTS %s CASCADE' % OLD_SCHEMA)
+        cursor.execute('CREATE SCHEMA %s' % OLD_SCHEMA)
+    tables = swapped_tables()
+    # fresh statistics, so the first queries on the new tables get good
+    # plans rather than waiting for autovacuum
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute('ANALYZE %s.%s' % (SHADOW_SCHEMA, qn(table)))
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            with transaction.atomic(using=connection.alias), \
+                    connection.cursor() as cursor:
+                cursor.execute(
+                    'SET LOCAL lock_timeout = %s', [SWAP_LOCK_TIMEOUT])
+                for table in tables:
+                    cursor.execute('ALTER TABLE %s.%s SET SCHEMA %s' % (
+                        qn(live), qn(table), OLD_SCHEMA))
+                for table in tables:
+                    cursor.execute('ALTER TABLE %s.%s SET SCHEMA %s' % (
+                        SHADOW_SCHEMA, qn(table), qn(live)))
+                DataImport.objects.using(connection.alias).create(**imported)
+            return
+        except OperationalError as e:
+            if attempt == SWAP_ATTEMPTS:
+                raise CommandError(
+                    "Couldn't swap in the shadow tables, queries kept them "
+                    "locked (%s). Try again with --resume." % e)
+            time.sleep(SWAP_PAUSE)
+
+
+def swap_files(connection, imported):
+    live = connection.settings_dict['NAME']
+    path = shadow_path(connection)
+    swapped = set(swapped_tables())
+    # every table of another model, whatever its app
+    kept = [model._meta.db_table
+            for model in apps.get_models(include_auto_created=True)
+            if model._meta.db_table not in swapped]
+    fields = [field for field in DataImport._meta.concrete_fields
+              if not field.primary_key]
+    values = [field.get_db_prep_value(imported[field.attname], connection)
+              for field in fields]
+    with connection.cursor() as cursor:
+        # keeps anyone else from writing to the live database until it's
+        # been replaced; reading goes on
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            shadow = sqlite3.connect(path, isolation_level=None)
+            try:
+                shadow.execute('ATTACH DATABASE ? AS live', [live])
+                shadow.execute('BEGIN')
+                for table in kept:
+                    columns = copied_columns(shadow, table)
+                    if not columns:
+                        continue
+                    shadow.execute('DELETE FROM main."%s"' % table)
+                    shadow.execute(
+                        'INSERT INTO main."{0}" ({1}) '
+                        'SELECT {1} FROM live."{0}"'.format(table, columns))
+                shadow.execute(
+                    'DELETE FROM main.sqlite_sequence WHERE name IN (%s)'
+                    % ', '.join('?' * len(kept)), kept)
+                shadow.execute(
+                    'INSERT INTO main.sqlite_sequence '
+                    'SELECT * FROM live.sqlite_sequence WHERE name IN (%s)'
+                    % ', '.join('?' * len(kept)), kept)
+                shadow.execute(
+                    'INSERT INTO ppts_dataimport (%s) VALUES (%s)' % (
+                        ', '.join('"%s"' % field.column for field in fields),
+                        ', '.join('?' * len(fields))), values)
+                shadow.execute('COMMIT')
+                shadow.execute('DETACH DATABASE live')
+            finally:
+                shadow.close()
+            os.replace(path, live)
+        finally:
+            cursor.execute('ROLLBACK')
+    # the next query opens the new file
+    connection.close()
+
+
+def copied_columns(shadow, table):
+    """The quoted columns table has in both databases, empty if it isn't
+    in both."""
+    columns = []
+    shadow_columns = set(
+        row[1] for row in shadow.execute('PRAGMA main.table_info("%s")'
+                                         % table))
+    for row in shadow.execute('PRAGMA live.table_info("%s")' % table):
+        if row[1] in shadow_columns:
+            columns.append('"%s"' % row[1])
+    return ', '.join(columns)
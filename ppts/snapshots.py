@@ -0,0 +1,194 @@
+"""Columnar snapshots of the imported tables.
+
+A snapshot is a directory holding one file per table, named after the
+table: ppts_record.parquet, ppts_location.parquet, ... Columns are the
+table's columns with a fixed type derived from the model (see schema()), so
+restoring one is a straight copy through a ppts.writers backend, without
+any of the CSV parsing, date inference or normalization loadppts does.
+
+    python manage.py dumpppts snapshot/
+    python manage.py loadppts snapshot/
+
+Tables are Parquet by default, or Arrow IPC files (.arrow), which are
+larger but are memory mapped and read without decoding. Snapshots need
+pyarrow 3.0 or later, which is in the Pipfile; the rest of the site works
+without it.
+"""
+import itertools
+import os
+
+from django.core.management.base import CommandError
+from django.core.management.color import no_style
+from django.db import transaction
+
+from ppts.models import DwellingType
+from ppts.models import LandUse
+from ppts.models import Location
+from ppts.models import Planner
+from ppts.models import ProjectDescription
+from ppts.models import ProjectFeature
+from ppts.models import Record
+from ppts.models import RecordType
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+
+# in the order they're restored, so foreign keys point at existing rows
+MODELS = [
+    RecordType,
+    Planner,
+    ProjectDescription,
+    Location,
+    Record,
+    Record.project_description.through,
+    Record.parent.through,
+    LandUse,
+    ProjectFeature,
+    DwellingType,
+]
+FORMATS = ('parquet', 'arrow')
+BATCH_SIZE = 50000
+
+
+def require_pyarrow():
+    if pa is None:
+        raise CommandError(
+            'Snapshots need pyarrow, install it with: pipenv install')
+
+
+def fields(model):
+    """Names of the model's columns, as used by the writers."""
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def arrow_type(field):
+    if field.is_relation:
+        field = field.target_field
+    kind = field.get_internal_type()
+    if kind in ('AutoField', 'IntegerField', 'BigIntegerField'):
+        return pa.int64()
+    if kind in ('CharField', 'TextField'):
+        return pa.string()
+    if kind == 'FloatField':
+        return pa.float64()
+    if kind == 'DecimalField':
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if kind == 'DateField':
+        return pa.date32()
+    if kind == 'BooleanField':
+        return pa.bool_()
+    raise ValueError('No snapshot type for %s' % field)
+
+
+def schema(model):
+    """The Arrow schema a model's table is stored with."""
+    return pa.schema([
+        pa.field(field.attname, arrow_type(field), nullable=field.null)
+        for field in model._meta.concrete_fields])
+
+
+def table_path(directory, model, format):
+    return os.path.join(directory, '%s.%s' % (model._meta.db_table, format))
+
+
+def find_table(directory, model):
+    for format in FORMATS:
+        path = table_path(directory, model, format)
+        if os.path.exists(path):
+            return path, format
+    raise CommandError('%s is not a snapshot, it has no %s table' % (
+        directory, model._meta.db_table))
+
+
+def dump_table(model, path, format, batch_size=BATCH_SIZE):
+    """Writes a table to path, batch_size rows at a time. Returns the count."""
+    names = fields(model)
+    table_schema = schema(model)
+    if format == 'parquet':
+        out = pq.ParquetWriter(path, table_schema)
+    else:
+        out = pa.ipc.new_file(path, table_schema)
+    rows = model.objects.order_by('pk').values_list(*names).iterator(
+        chunk_size=batch_size)
+    count = 0
+    with out:
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            count += len(batch)
+            columns = [list(column) for column in zip(*batch)]
+            out.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type)
+                 for (values, field) in zip(columns, table_schema)],
+                schema=table_schema))
+    return count
+
+
+def dump(directory, format='parquet'):
+    """Writes every table to a snapshot in directory.
+
+    Returns (model, row count) for every table.
+    """
+    require_pyarrow()
+    os.makedirs(directory, exist_ok=True)
+    with transaction.atomic():
+        return [(model, dump_table(model, table_path(directory, model, format),
+                                   format))
+                for model in MODELS]
+
+
+def read_batches(path, format):
+    """The table at path as a sequence of RecordBatches."""
+    if format == 'parquet':
+        table = pq.ParquetFile(path, memory_map=True)
+        return table.schema_arrow, table.iter_batches(batch_size=BATCH_SIZE)
+    reader = pa.ipc.open_file(pa.memory_map(path))
+    return reader.schema, (reader.get_batch(i)
+                           for i in range(reader.num_record_batches))
+
+
+def restore_table(model, path, format, writer):
+    table_schema, batches = read_batches(path, format)
+    expected = schema(model)
+    if not table_schema.equals(expected):
+        raise CommandError(
+            "%s doesn't match the %s table, it was probably dumped before a "
+            "migration.\nExpected:\n%s\nFound:\n%s" % (
+                path, model._meta.db_table, expected, table_schema))
+    names = fields(model)
+    count = 0
+    for batch in batches:
+        columns = [column.to_pylist() for column in batch.columns]
+        rows = list(zip(*columns))
+        # pyarrow hands back dates, Decimals, ... already
+        writer.write(model, names, rows, prepared=True)
+        count += len(rows)
+    return count
+
+
+def restore(directory, writer):
+    """Loads the snapshot in directory into the (empty) tables.
+
+    Returns (model, row count) for every table.
+    """
+    require_pyarrow()
+    paths = [find_table(directory, model) for model in MODELS]
+    for model in MODELS:
+        if model.objects.exists():
+            raise CommandError(
+                'The %s table already holds data, snapshots can only be '
+                'loaded into an empty database' % model._meta.db_table)
+    connection = writer.connection
+    with transaction.atomic(using=connection.alias):
+        counts = [(model, restore_table(model, path, format, writer))
+                  for (model, (path, format)) in zip(MODELS, paths)]
+        # rows came with their ids, move the sequences past them
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), MODELS):
+                cursor.execute(sql)
+    return counts
@@ -0,0 +1,145 @@
+"""Opening the PPTS export for loadppts.
+
+open_source takes a filename, or '-' for standard input, and returns a
+Source: a binary file object of CSV text that decompresses on the fly, so
+nothing is staged on disk. gzip, bz2, xz and zip are recognized by their
+first bytes rather than the file name, so piped input works too:
+
+    zcat snapshot.csv.gz | python manage.py loadppts -
+    python manage.py loadppts snapshot.csv.xz
+"""
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import sys
+import zipfile
+
+from django.core.management.base import CommandError
+
+
+MAGIC = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'PK\x03\x04', 'zip'),
+]
+
+
+class CountingReader(io.RawIOBase):
+    """Passes reads through to raw, counting the bytes."""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.bytes_read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.raw.readinto(b)
+        if n:
+            self.bytes_read += n
+        return n
+
+    # zipfile needs to seek around in the file
+    def seekable(self):
+        return self.raw.seekable()
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self.raw.seek(offset, whence)
+
+    def tell(self):
+        return self.raw.tell()
+
+
+class Source():
+    """An open input file.
+
+    file yields the uncompressed CSV; bytes_read counts what has been read
+    from the underlying file or pipe so far, and size is its total size
+    (None for a pipe).
+    """
+
+    def __init__(self, file, counter, size, compression):
+        self.file = file
+        self.counter = counter
+        self.size = size
+        self.compression = compression
+
+    @property
+    def bytes_read(self):
+        return self.counter.bytes_read
+
+    def progress(self):
+        done = self.bytes_read / 1e6
+        if self.size:
+            return '%.1f of %.1f MB' % (done, self.size / 1e6)
+        return '%.1f MB' % done
+
+    def close(self):
+        self.file.close()
+        self.counter.raw.close()
+
+
+def detect_compression(buffered):
+    head = buffered.peek(8)
+    for (magic, compression) in MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_zip_member(buffered, filename):
+    if not buffered.seekable():
+        raise CommandError(
+            "%s is a zip archive, which can't be streamed from a pipe. Pass "
+            "the file name instead, or pipe it through funzip." % filename)
+    archive = zipfile.ZipFile(buffered)
+    members = [name for name in archive.namelist()
+               if not name.endswith('/')]
+    csvs = [name for name in members if name.lower().endswith('.csv')]
+    if len(csvs) == 1:
+        return archive.open(csvs[0])
+    if len(members) == 1:
+        return archive.open(members[0])
+    raise CommandError(
+        "%s should contain a single CSV file, found: %s"
+        % (filename, ', '.join(members)))
+
+
+def open_source(filename):
+    """Opens filename ('-' for stdin) for reading, see the module docstring."""
+    if filename == '-':
+        raw = sys.stdin.buffer
+        size = None
+    else:
+        raw = open(filename, 'rb')
+        size = os.fstat(raw.fileno()).st_size
+    counter = CountingReader(raw)
+    buffered = io.BufferedReader(counter)
+    compression = detect_compression(buffered)
+    if compression == 'gzip':
+        file = gzip.GzipFile(fileobj=buffered)
+    elif compression == 'bz2':
+        file = bz2.BZ2File(buffered)
+    elif compression == 'xz':
+        file = lzma.LZMAFile(buffered)
+    elif compression == 'zip':
+        file = open_zip_member(buffered, filename)
+    else:
+        file = buffered
+    return Source(file, counter, size, compression)
+
+
+def file_hash(filename):
+    """md5 of the file as stored (before decompressing), '' for stdin."""
+    if filename == '-':
+        return ''
+    digest = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
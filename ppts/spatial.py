@@ -0,0 +1,72 @@
+"""Bounding box and radius queries over Locations.
+
+loadppts stores each Location's bounding box and centroid (see
+transform.geometry_bounds), and the bounding boxes are indexed with the
+database's own R-tree, which migration 0008 sets up:
+
+- SQLite: an R*Tree virtual table, ppts_location_rtree, kept up to date by
+  triggers on ppts_location.
+- PostgreSQL: a GiST index on box(point(min_lon, min_lat),
+  point(max_lon, max_lat)), with the built-in geometric types, so it
+  doesn't need PostGIS.
+
+Anywhere else the queries fall back to the plain indexes on the columns.
+Coordinates are degrees (WGS84), distances metres.
+"""
+import math
+
+from django.db import connections
+from django.db.models import F
+
+from ppts import sql
+
+RTREE_TABLE = 'ppts_location_rtree'
+# metres in a degree of latitude
+METERS_PER_DEGREE = 111320
+
+
+def has_rtree(connection):
+    """Whether the database has the R*Tree table (SQLite can be built
+    without the module, in which case the migration skips it)."""
+    return sql.has_table(connection, RTREE_TABLE)
+
+
+def in_bbox(locations, west, south, east, north):
+    """The locations whose bounding box overlaps west, south, east, north."""
+    connection = connections[locations.db]
+    if connection.vendor == 'postgresql':
+        locations = locations.filter(id__in=sql.RawSubquery(
+            'SELECT id FROM ppts_location WHERE '
+            'box(point(min_lon, min_lat), point(max_lon, max_lat)) && '
+            'box(point(%s, %s), point(%s, %s))',
+            (west, south, east, north)))
+    elif connection.vendor == 'sqlite' and has_rtree(connection):
+        locations = locations.filter(id__in=sql.RawSubquery(
+            'SELECT id FROM %s WHERE min_lon <= %%s AND max_lon >= %%s AND '
+            'min_lat <= %%s AND max_lat >= %%s' % RTREE_TABLE,
+            (east, west, north, south)))
+    # the R*Tree stores 32-bit floats, rounded outwards, so it can return a
+    # few boxes that only touch; these are exact
+    return locations.filter(
+        min_lon__lte=east, max_lon__gte=west,
+        min_lat__lte=north, max_lat__gte=south)
+
+
+def near(locations, lon, lat, meters):
+    """The locations whose centroid is within meters of lon, lat.
+
+    Distances are on an equirectangular projection around lat, which is
+    well within a metre of the great circle distance at city scale.
+    """
+    dlat = meters / METERS_PER_DEGREE
+    scale = math.cos(math.radians(lat))
+    dlon = dlat / max(scale, 1e-6)
+    # a parcel's bounding box holds its centroid, so the centroids within
+    # the circle are in boxes that overlap the square around it
+    candidates = in_bbox(locations, lon - dlon, lat - dlat, lon + dlon,
+                         lat + dlat)
+    dx = (F('centroid_lon') - lon) * scale
+    dy = F('centroid_lat') - lat
+    return candidates.annotate(
+        distance_squared=dx * dx + dy * dy,
+    ).filter(distance_squared__lte=dlat * dlat)
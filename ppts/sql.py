@@ -0,0 +1,23 @@
+"""Helpers for the raw SQL behind ppts.spatial and ppts.search, which use
+indexes Django doesn't know about (see migrations 0008 and 0009)."""
+from django.db.models.expressions import RawSQL
+
+_tables = {}
+
+
+class RawSubquery(RawSQL):
+    """RawSQL for the right hand side of an __in lookup, which brackets it
+    itself (bracketed twice, SQLite takes it as a list of one value)."""
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def has_table(connection, name):
+    """Whether the database has table name. Looked up once per process,
+    for tables a migration only creates when the database supports them."""
+    key = (connection.alias, name)
+    if key not in _tables:
+        with connection.cursor() as cursor:
+            _tables[key] = name in connection.introspection.table_names(cursor)
+    return _tables[key]
@@ -0,0 +1,96 @@
+"""The rollup tables the dashboards read, RecordSummary and
+ProjectDescriptionSummary.
+
+They're rebuilt from scratch at the end of every loadppts run, which is a
+few GROUP BY queries over the imported tables. Record counts and unit sums
+are grouped separately, so joining the features in doesn't count a record
+once per feature.
+"""
+import collections
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Sum
+from django.db.models.functions import ExtractYear
+
+from ppts.models import ProjectDescriptionSummary
+from ppts.models import ProjectFeature
+from ppts.models import Record
+from ppts.models import RecordSummary
+
+# the ProjectFeatures that are dwelling units
+UNITS = (ProjectFeature.MARKET_RATE, ProjectFeature.AFFORDABLE)
+
+
+def rollup(model, group, records, features):
+    """Rows of model, one per group.
+
+    records has a 'records' count and features a 'net' sum per feature
+    type, both for the group fields named in group.
+    """
+    rows = collections.OrderedDict()
+    for row in records:
+        key = tuple(row[name] for name in group)
+        rows[key] = model(
+            records=row['records'],
+            net_units=Decimal(0),
+            net_affordable_units=Decimal(0),
+            **dict(zip(group, key)))
+    for row in features:
+        summary = rows.get(tuple(row[name] for name in group))
+        if summary is None or row['net'] is None:
+            continue
+        summary.net_units += row['net']
+        if row['type'] == ProjectFeature.AFFORDABLE:
+            summary.net_affordable_units += row['net']
+    return list(rows.values())
+
+
+def record_summaries():
+    group = ('record_type_id', 'status', 'year')
+    records = Record.objects.values(
+        'record_type_id', 'status', year=ExtractYear('date_opened'),
+    ).annotate(records=Count('id')).order_by()
+    features = ProjectFeature.objects.filter(
+        type__in=UNITS, record__isnull=False,
+    ).values(
+        'type',
+        record_type_id=F('record__record_type_id'),
+        status=F('record__status'),
+        year=ExtractYear('record__date_opened'),
+    ).annotate(net=Sum('net')).order_by()
+    return rollup(RecordSummary, group, records, features)
+
+
+def project_description_summaries():
+    group = ('project_description_id', 'status', 'year')
+    Through = Record.project_description.through
+    records = Through.objects.values(
+        project_description_id=F('projectdescription_id'),
+        status=F('record__status'),
+        year=ExtractYear('record__date_opened'),
+    ).annotate(records=Count('record_id')).order_by()
+    features = ProjectFeature.objects.filter(
+        type__in=UNITS, record__project_description__isnull=False,
+    ).values(
+        'type',
+        project_description_id=F('record__project_description'),
+        status=F('record__status'),
+        year=ExtractYear('record__date_opened'),
+    ).annotate(net=Sum('net')).order_by()
+    return rollup(ProjectDescriptionSummary, group, records, features)
+
+
+def rebuild():
+    """Recomputes both summary tables. Returns (model, row count) for each."""
+    counts = []
+    with transaction.atomic():
+        for (model, summaries) in (
+                (RecordSummary, record_summaries()),
+                (ProjectDescriptionSummary, project_description_summaries())):
+            model.objects.all().delete()
+            model.objects.bulk_create(summaries)
+            counts.append((model, len(summaries)))
+    return counts
@@ -0,0 +1,340 @@
+"""Synthetic PPTS exports, for tests and benchmarks without the real file.
+
+    python manage.py fakeppts /tmp/ppts.csv --rows 100000
+
+writes a CSV with the columns and formats of the Planning Department's
+export, which loadppts reads like the real one:
+
+- a record type and status mix where a few values cover most records,
+  with some categories spelled out ("Project Profile (PRJ)") as in the
+  export, for loadppts to clean up;
+- 20 years of opening dates ("07/26/2018 12:00:00 AM"), closing dates
+  on closed records, now and then a hearing date;
+- parcels as WKT multipolygons, a quarter of them shared by several
+  records, and the records of a project on their project's parcel;
+- projects (PRJ) with their child records, linked both ways through the
+  comma separated parent and children columns, the children a few
+  thousand rows after the project so the links cross chunks, and a few
+  parents that aren't in the file;
+- on projects (and a few others) the ProjectDescription flags, and every
+  LAND_USE_*, PRJ_FEATURE_* and RESIDENTIAL_* column family.
+
+The output only depends on the number of rows and the seed. export()
+keeps each file it writes, for the tests and benchmarks to read again.
+"""
+import csv
+import datetime
+import hashlib
+import heapq
+import os
+import random
+
+from ppts.models import DwellingType
+from ppts.models import LandUse
+from ppts.models import ProjectDescription
+from ppts.models import ProjectFeature
+from ppts import transform
+
+# (category, record_type, share of records)
+RECORD_TYPES = [
+    ('PRJ', 'Project Profile (PRJ)', 12),
+    ('ENV', 'Environmental (ENV)', 14),
+    ('PPA', 'Preliminary Project Assessment (PPA)', 6),
+    ('CUA', 'Conditional Use Authorization (CUA)', 5),
+    ('VAR', 'Variance (VAR)', 4),
+    ('DRP', 'Discretionary Review (DRP)', 8),
+    ('PRL', 'Project Referral (PRL)', 6),
+    ('MIS', 'Miscellaneous (MIS)', 10),
+    ('COA', 'Certificate of Appropriateness (COA)', 3),
+    ('SHD', 'Shadow Analysis (SHD)', 2),
+    ('TDM', 'Transportation Demand Management (TDM)', 2),
+    ('REF', 'Referral (REF)', 20),
+    ('Other', 'Other', 8),
+]
+STATUSES = [
+    ('Closed', 40), ('Accepted', 16), ('Under Review', 9), ('Approved', 10),
+    ('Withdrawn', 8), ('Open', 6), ('Closed - CEQA', 5), ('Cancelled', 3),
+    ('On Hold', 2), ('Disapproved', 1),
+]
+ENVIRONMENTAL_REVIEW_TYPES = [
+    'Categorical Exemption-Certificate', 'Categorical Exemption-Stamp',
+    'Community Plan Exemption', 'Negative Declaration',
+    'Environmental Impact Report']
+WORDS = (
+    'residential commercial retail office garage demolition construction '
+    'addition rear front horizontal vertical story unit units dwelling '
+    'accessory building existing new proposed legalize convert change use '
+    'restaurant cannabis storefront facade window deck stairs mixed family '
+    'single two three four market rate affordable housing lot merger '
+    'subdivision parking bicycle').split()
+STREETS = (
+    'Mission', 'Market', 'Valencia', 'Folsom', 'Howard', 'Geary', 'Clement',
+    'Irving', 'Judah', 'Taraval', 'Noriega', 'Divisadero', 'Fillmore',
+    'Polk', 'Van Ness', 'Hayes', 'Haight', 'Castro', 'Church', 'Dolores')
+PLANNERS = 200
+FIRST_DAY = datetime.date(2000, 1, 1)
+DAYS = 20 * 365
+# the child records of a project come at most this many rows after it
+SPREAD = 5000
+CHECKED = 'CHECKED'
+
+# in the order of the export
+RECORD_COLUMNS = [
+    'OBJECTID', 'the_geom', 'record_id', 'record_type',
+    'record_type_category', 'record_name', 'description', 'planner_id',
+    'planner_name', 'planner_email', 'planner_phone', 'record_status',
+    'date_opened', 'date_closed', 'parent', 'children', 'templateid',
+    'record_type_subtype', 'record_type_type', 'record_type_group',
+    'module', 'address', 'constructcost', 'RELATED_BUILDING_PERMIT',
+    'acalink', 'aalink', 'MCD_REFERRAL', 'ENVIRONMENTAL_REVIEW_TYPE',
+    'BOS_1ST_READ', 'BOS_2ND_READ', 'COM_HEARING', 'MAYORAL_SIGN',
+    'TRANSMIT_DATE_BOS', 'COM_HEARING_DATE_BOS',
+]
+# dates other than date_opened and date_closed, filled in now and then
+HEARING_COLUMNS = RECORD_COLUMNS[-6:]
+
+
+def family(prefix, types, suffixes):
+    return ['_'.join([prefix, type, suffix])
+            for type in types for suffix in suffixes]
+
+
+COLUMNS = (
+    RECORD_COLUMNS
+    + transform.choices(ProjectDescription)
+    + family('LAND_USE', transform.choices(LandUse),
+             ('EXIST', 'PROP', 'NET'))
+    + ['PRJ_FEATURE_OTHER']
+    + family('PRJ_FEATURE', transform.choices(ProjectFeature),
+             ('EXIST', 'PROP', 'NET'))
+    + family('RESIDENTIAL', transform.choices(DwellingType),
+             ('EXIST', 'PROP', 'NET', 'AREA'))
+    + ['Shape_Length', 'Shape_Area'])
+# every column, blank, in order
+BLANK = dict.fromkeys(COLUMNS, '')
+
+
+def fraction(x):
+    return x - int(x)
+
+
+def parcel(number):
+    """the_geom, Shape_Length, Shape_Area and address of a parcel.
+
+    Worked out from its number rather than kept, so a million of them take
+    no memory: a square somewhere in San Francisco, with every seventh
+    parcel in two parts.
+    """
+    lon = -122.51 + 0.14 * fraction(number * 0.6180339887)
+    lat = 37.71 + 0.10 * fraction(number * 0.7548776662)
+    side = 0.0001 + 0.0003 * fraction(number * 0.5698402910)
+    squares = [(lon, lat)]
+    if number % 7 == 0:
+        squares.append((lon + 2 * side, lat))
+    polygons = ', '.join(
+        '((%.6f %.6f, %.6f %.6f, %.6f %.6f, %.6f %.6f, %.6f %.6f))' % (
+            x, y, x + side, y, x + side, y + side, x, y + side, x, y)
+        for (x, y) in squares)
+    return {
+        'the_geom': 'MULTIPOLYGON (%s)' % polygons,
+        'Shape_Length': '%.6f' % (4 * side * len(squares)),
+        'Shape_Area': '%.12f' % (side * side * len(squares)),
+        'address': '%d %s St' % (100 + number % 3000,
+                                 STREETS[number % len(STREETS)]),
+    }
+
+
+def date(day):
+    return day.strftime('%m/%d/%Y 12:00:00 AM')
+
+
+class Generator():
+    """Makes the records, a project and its children at a time, as dicts
+    of column: value."""
+
+    def __init__(self, seed=1):
+        self.rand = random.Random(seed)
+        self.records = 0
+        self.parcels = 0
+        types = [(category, name) for (category, name, share) in RECORD_TYPES]
+        shares = [share for (category, name, share) in RECORD_TYPES]
+        self.record_type = lambda: self.rand.choices(types, shares)[0]
+        self.status = lambda: self.rand.choices(
+            [status for (status, share) in STATUSES],
+            [share for (status, share) in STATUSES])[0]
+        self.descriptions = transform.choices(ProjectDescription)
+        self.land_uses = transform.choices(LandUse)
+        self.features = [feature
+                         for feature in transform.choices(ProjectFeature)
+                         if feature != ProjectFeature.OTHER]
+        self.dwelling_types = transform.choices(DwellingType)
+
+    def text(self, low, high):
+        return ' '.join(
+            self.rand.choices(WORDS, k=self.rand.randint(low, high)))
+
+    def parcel(self):
+        if self.parcels and self.rand.random() < 0.25:
+            return self.rand.randrange(self.parcels)
+        self.parcels += 1
+        return self.parcels - 1
+
+    def group(self):
+        """A record, or a project and its child records, as (delay, row):
+        how many rows later than the project each one should come."""
+        (category, name) = self.record_type()
+        number = self.parcel()
+        opened = None
+        if self.rand.random() < 0.9:
+            opened = FIRST_DAY + datetime.timedelta(self.rand.randrange(DAYS))
+        row = self.record(category, name, number, opened)
+        if category != 'PRJ':
+            if self.rand.random() < 0.02:
+                # a project from before the export
+                row['parent'] = '1999-%06dPRJ' % self.records
+            return [(0, row)]
+        group = [(0, row)]
+        children = self.rand.choices((0, 1, 2, 3, 4), (30, 35, 20, 10, 5))[0]
+        for i in range(children):
+            (category, name) = self.record_type()
+            while category == 'PRJ':
+                (category, name) = self.record_type()
+            child_opened = opened
+            if opened is not None:
+                child_opened += datetime.timedelta(self.rand.randrange(365))
+            child = self.record(category, name, number, child_opened)
+            child['parent'] = row['record_id']
+            if self.rand.random() < 0.03:
+                child['parent'] += ',1999-%06dPRJ' % self.records
+            group.append((self.rand.randrange(SPREAD), child))
+        row['children'] = ','.join(
+            child['record_id'] for (delay, child) in group[1:])
+        return group
+
+    def record(self, category, name, number, opened):
+        rand = self.rand
+        self.records += 1
+        year = opened.year if opened else FIRST_DAY.year
+        record_id = '%d-%06d%s' % (year, self.records, category[:3].upper())
+        planner = rand.randrange(PLANNERS)
+        status = self.status()
+        row = {
+            'record_id': record_id,
+            'record_type': name,
+            'record_type_category':
+                name if rand.random() < 0.15 else category,
+            'record_name': self.text(2, 6).capitalize(),
+            'description': self.text(5, 40).capitalize() + '.',
+            'planner_id': 'PL%03d' % planner,
+            'planner_name': 'Planner %d' % planner,
+            'planner_email': 'planner%d@sfgov.org' % planner,
+            'planner_phone': '415-558-%04d' % planner,
+            'record_status': status,
+            'templateid': 'TPL%07d' % self.records,
+            'record_type_subtype': 'NA',
+            'record_type_type': 'NA',
+            'record_type_group': 'Planning',
+            'module': 'Planning',
+            'acalink': 'https://aca.sfplanning.org/record/%s' % record_id,
+            'aalink': 'https://aa.sfplanning.org/record/%s' % record_id,
+        }
+        if rand.random() > 0.03:
+            row.update(parcel(number))
+        if opened is not None:
+            row['date_opened'] = date(opened)
+            if status.startswith('Closed'):
+                row['date_closed'] = date(
+                    opened + datetime.timedelta(rand.randrange(900)))
+            if category in ('PRJ', 'CUA', 'DRP') and rand.random() < 0.1:
+                column = rand.choice(HEARING_COLUMNS)
+                row[column] = date(
+                    opened + datetime.timedelta(rand.randrange(60, 700)))
+        if category == 'PRJ' and rand.random() < 0.6:
+            row['constructcost'] = '%.1f' % rand.randrange(0, 50000000, 1000)
+        if rand.random() < 0.1:
+            row['RELATED_BUILDING_PERMIT'] = '%d%07d' % (
+                year, rand.randrange(10000000))
+        if category == 'ENV':
+            row['ENVIRONMENTAL_REVIEW_TYPE'] = rand.choice(
+                ENVIRONMENTAL_REVIEW_TYPES)
+        if rand.random() < 0.02:
+            row['MCD_REFERRAL'] = 'Yes'
+        if category == 'PRJ' or rand.random() < 0.05:
+            self.project_details(row)
+        return row
+
+    def project_details(self, row):
+        """The ProjectDescription flags and the child table columns."""
+        rand = self.rand
+        for description in rand.sample(self.descriptions, rand.randint(1, 3)):
+            row[description] = CHECKED
+        for type in rand.sample(self.land_uses, rand.randint(0, 3)):
+            exist = rand.choice((0, rand.randint(1, 20000)))
+            proposed = rand.randint(0, 40000)
+            row.update(amounts('LAND_USE_' + type, exist, proposed))
+        for type in rand.sample(self.features, rand.randint(0, 4)):
+            exist = rand.choice((0, rand.randint(1, 20)))
+            proposed = rand.randint(0, 200)
+            row.update(amounts('PRJ_FEATURE_' + type, exist, proposed))
+        if rand.random() < 0.05:
+            row['PRJ_FEATURE_OTHER'] = self.text(1, 3)
+            row.update(amounts('PRJ_FEATURE_OTHER', 0, rand.randint(0, 10)))
+        for type in rand.sample(self.dwelling_types, rand.randint(0, 2)):
+            exist = rand.choice((0, 0, rand.randint(1, 10)))
+            proposed = rand.randint(1, 100)
+            row.update(amounts('RESIDENTIAL_' + type, exist, proposed))
+            row['RESIDENTIAL_%s_AREA' % type] = str(
+                proposed * rand.randint(350, 1100))
+
+
+def amounts(prefix, exist, proposed):
+    return {
+        prefix + '_EXIST': str(exist),
+        prefix + '_PROP': str(proposed),
+        prefix + '_NET': str(proposed - exist),
+    }
+
+
+def rows(count, seed=1):
+    """Yields the header and then count rows, as lists of strings."""
+    yield COLUMNS
+    generator = Generator(seed)
+    # (row number it comes out at, order made, row) of the rows made but
+    # not yet yielded: at most a few projects' children
+    pending = []
+    made = 0
+    for number in range(count):
+        while made < count and (not pending or pending[0][0] > number):
+            for (delay, row) in generator.group():
+                if made == count:
+                    break
+                heapq.heappush(pending, (number + delay, made, row))
+                made += 1
+        (position, order, row) = heapq.heappop(pending)
+        row['OBJECTID'] = str(number + 1)
+        values = dict(BLANK)
+        values.update(row)
+        yield list(values.values())
+
+
+def write(f, count, seed=1):
+    """Writes a synthetic export of count records to the text file f."""
+    csv.writer(f).writerows(rows(count, seed))
+
+
+def export(directory, count, seed=1):
+    """The path of a synthetic export of count records in directory,
+    written if it isn't there yet. The name has a hash of this module, so a
+    change to the generator makes a new file."""
+    with open(__file__, 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:8]
+    path = os.path.join(
+        directory, 'ppts-%d-%d-%s.csv' % (count, seed, version))
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        # written aside and renamed, so a half written file is never used
+        part = '%s.%d.part' % (path, os.getpid())
+        with open(part, 'w', newline='') as f:
+            write(f, count, seed)
+        os.replace(part, path)
+    return path
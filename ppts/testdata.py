@@ -0,0 +1,89 @@
+"""The tests' export, and imports of it restored from a snapshot after
+the first run.
+
+export() is a synthetic export (see ppts.synthetic), written to SNAPSHOTS
+the first time, so the tests need no real one.
+
+    testdata.load(testdata.export(), '--quicktest')
+
+leaves the database as call_command('loadppts', ...) would, but only runs
+loadppts the first time: the imported tables are then dumped as a dumpppts
+snapshot (Arrow files, see ppts.snapshots) to SNAPSHOTS, and later calls
+load the snapshot instead. That copies the rows straight in (with COPY on
+PostgreSQL) rather than parsing the CSV again, then rebuilds the rollup
+tables and records the DataImport, as loadppts does with any snapshot.
+
+A snapshot is named after a hash of the input file, the arguments, the
+database backend and every module of the ppts app but the tests, so any
+change to the import (or the models) makes a new one. Delete SNAPSHOTS to
+start over. Without pyarrow, load() just runs loadppts.
+"""
+import glob
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.db import connection
+
+from ppts import snapshots
+from ppts import sources
+from ppts import synthetic
+
+SNAPSHOTS = os.environ.get('PPTS_TEST_SNAPSHOTS', os.path.join(
+    tempfile.gettempdir(), 'ppts-test-snapshots'))
+APP = os.path.dirname(os.path.abspath(__file__))
+
+# enough for a few chunks of 1000 rows
+EXPORT_ROWS = 3000
+
+
+def export(rows=EXPORT_ROWS, seed=1):
+    """The path of a synthetic export of rows records."""
+    return synthetic.export(SNAPSHOTS, rows, seed)
+
+
+def key(filename, args):
+    """What a snapshot of loadppts filename args depends on, hashed."""
+    digest = hashlib.sha1()
+    digest.update(sources.file_hash(filename).encode('utf-8'))
+    digest.update(repr(args).encode('utf-8'))
+    digest.update(connection.vendor.encode('utf-8'))
+    for path in sorted(glob.glob(os.path.join(APP, '**', '*.py'),
+                                 recursive=True)):
+        if os.path.basename(path) == 'tests.py':
+            continue
+        digest.update(os.path.relpath(path, APP).encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def load(filename, *args):
+    """Imports filename like loadppts with args, from a snapshot if there's
+    one. Returns the path of the snapshot loaded, None if loadppts ran."""
+    output = io.StringIO()
+    if snapshots.pa is None:
+        call_command('loadppts', filename, *args, stdout=output)
+        return None
+    path = os.path.join(SNAPSHOTS, '%s-%s' % (
+        os.path.basename(filename), key(filename, args)))
+    if os.path.isdir(path):
+        call_command('loadppts', path, stdout=output)
+        return path
+    call_command('loadppts', filename, *args, stdout=output)
+    os.makedirs(SNAPSHOTS, exist_ok=True)
+    # written aside and renamed, so a test run that stops halfway (or one
+    # beside it) never sees half a snapshot
+    partial = tempfile.mkdtemp(dir=SNAPSHOTS)
+    try:
+        snapshots.dump(partial, 'arrow')
+        os.rename(partial, path)
+    except OSError:
+        # another run got there first
+        pass
+    finally:
+        shutil.rmtree(partial, ignore_errors=True)
+    return None
@@ -0,0 +1,332 @@
+"""Column-wise versions of the loadppts row transforms.
+
+The PPTS export spreads each child table across a family of columns, one
+group per type, e.g. LAND_USE_RC_EXIST, LAND_USE_RC_PROP, LAND_USE_RC_NET,
+LAND_USE_OFFICE_EXIST, ...  The functions here work on a whole chunk of the
+CSV at once: each family is stacked into a (rows, types, values) array, rows
+where every value is zero are masked out, and what is left comes back as
+tuples in the order of the matching *_FIELDS constant.
+
+Output is in the same order as calling the per-row functions in
+ppts.reference (land_use, dwelling_type, ...) row by row, so ids assigned on
+insert come out the same.
+
+parse_chunk bundles everything that can be done to a chunk without knowing
+about the rest of the file, so loadppts can farm it out to worker
+processes.
+"""
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+
+from ppts.instrument import Stats
+from ppts.models import DwellingType
+from ppts.models import LandUse
+from ppts.models import ProjectDescription
+from ppts.models import ProjectFeature
+
+
+DATE_COLUMNS = [
+    "date_opened",
+    "date_closed",
+    "BOS_1ST_READ",
+    "BOS_2ND_READ",
+    "COM_HEARING",
+    "MAYORAL_SIGN",
+    "TRANSMIT_DATE_BOS",
+    "COM_HEARING_DATE_BOS",
+]
+# columns loadppts reads a row at a time, everything else is handled here
+ROW_COLUMNS = [
+    "OBJECTID", "the_geom", "record_id", "record_type",
+    "record_type_category", "record_name", "description", "planner_id",
+    "planner_name", "planner_email", "planner_phone", "record_status",
+    "parent", "children", "templateid", "record_type_subtype",
+    "record_type_type", "record_type_group", "module", "address",
+    "constructcost", "RELATED_BUILDING_PERMIT", "acalink", "aalink",
+    "MCD_REFERRAL", "ENVIRONMENTAL_REVIEW_TYPE", "Shape_Length",
+    "Shape_Area",
+] + DATE_COLUMNS
+
+RECORD_FIELDS = (
+    'id', 'planner_id', 'location_id', 'record_type_id', 'record_id',
+    'object_id', 'template_id', 'name', 'description', 'status',
+    'construct_cost', 'related_building_permit', 'acalink', 'aalink',
+    'date_opened', 'date_closed', 'bos_1st_read', 'bos_2nd_read',
+    'com_hearing', 'mayoral_sign', 'transmit_date_bos',
+    'com_hearing_date_bos', 'mcd_referral', 'environmental_review',
+    'source_hash')
+LOCATION_FIELDS = ('id', 'the_geom', 'shape_length', 'shape_area', 'address',
+                   'min_lon', 'min_lat', 'max_lon', 'max_lat',
+                   'centroid_lon', 'centroid_lat')
+PLANNER_FIELDS = ('id', 'planner_id', 'name', 'email', 'phone')
+RECORD_TYPE_FIELDS = (
+    'category', 'name', 'subtype', 'type', 'group', 'module')
+RELATION_FIELDS = ('from_record_id', 'to_record_id')
+LAND_USE_FIELDS = ('record_id', 'type', 'exist', 'proposed', 'net')
+PROJECT_FEATURE_FIELDS = (
+    'record_id', 'type', 'other_name', 'exist', 'proposed', 'net')
+DWELLING_TYPE_FIELDS = (
+    'record_id', 'type', 'exist', 'proposed', 'net', 'area')
+PROJECT_DESCRIPTION_FIELDS = ('record_id', 'projectdescription_id')
+
+
+def choices(model):
+    return [col for (col, _ignore) in model.CHOICES]
+
+
+def stack(chunk, prefix, types, suffixes):
+    """Stacks a column family into an array of shape (rows, types, suffixes).
+
+    values[r, t, s] holds column PREFIX_TYPE_SUFFIX of row r. Missing columns
+    and nulls are read as 0.
+    """
+    names = ["_".join([prefix, infix, suffix])
+             for infix in types for suffix in suffixes]
+    frame = chunk.reindex(columns=names)
+    text = frame.columns[frame.dtypes == object]
+    if len(text):
+        frame[text] = frame[text].apply(pd.to_numeric, errors='coerce')
+    values = frame.fillna(0).to_numpy(dtype=float)
+    return values.reshape(len(chunk), len(types), len(suffixes))
+
+
+def land_uses(chunk, record_ids):
+    """LandUse rows for a chunk, as tuples of LAND_USE_FIELDS.
+
+    record_ids holds the Record primary key of each row of the chunk.
+    """
+    types = choices(LandUse)
+    values = stack(chunk, "LAND_USE", types, ("EXIST", "PROP", "NET"))
+    rows, cols = np.nonzero(values.any(axis=2))
+    found = values[rows, cols]
+    return list(zip(
+        np.asarray(record_ids)[rows].tolist(),
+        np.asarray(types)[cols].tolist(),
+        found[:, 0].tolist(),
+        found[:, 1].tolist(),
+        found[:, 2].tolist()))
+
+
+def dwelling_types(chunk, record_ids):
+    """DwellingType rows for a chunk, as tuples of DWELLING_TYPE_FIELDS."""
+    types = choices(DwellingType)
+    values = stack(
+        chunk, "RESIDENTIAL", types, ("EXIST", "PROP", "NET", "AREA"))
+    rows, cols = np.nonzero(values.any(axis=2))
+    found = values[rows, cols]
+    return list(zip(
+        np.asarray(record_ids)[rows].tolist(),
+        np.asarray(types)[cols].tolist(),
+        found[:, 0].tolist(),
+        found[:, 1].tolist(),
+        found[:, 2].tolist(),
+        found[:, 3].tolist()))
+
+
+def project_features(chunk, record_ids):
+    """ProjectFeature rows for a chunk, as tuples of PROJECT_FEATURE_FIELDS.
+
+    The proposed amount isn't read from the PROP columns, it's exist + net
+    (see ppts.reference.project_feature).
+    """
+    types = choices(ProjectFeature)
+    values = stack(chunk, "PRJ_FEATURE", types, ("EXIST", "NET"))
+    # only the OTHER feature has a name, in the PRJ_FEATURE_OTHER column
+    other_name = np.full((len(chunk), len(types)), "", dtype=object)
+    other = "_".join(["PRJ_FEATURE", ProjectFeature.OTHER])
+    if other in chunk:
+        other_name[:, types.index(ProjectFeature.OTHER)] = (
+            chunk[other].fillna("").to_numpy())
+    mask = values.any(axis=2) | (other_name != "")
+    rows, cols = np.nonzero(mask)
+    found = values[rows, cols]
+    return list(zip(
+        np.asarray(record_ids)[rows].tolist(),
+        np.asarray(types)[cols].tolist(),
+        other_name[rows, cols].tolist(),
+        found[:, 0].tolist(),
+        (found[:, 0] + found[:, 1]).tolist(),
+        found[:, 1].tolist()))
+
+
+def project_descriptions(chunk, record_ids):
+    """Record.project_description through rows for a chunk, as tuples of
+    PROJECT_DESCRIPTION_FIELDS.
+
+    A description applies when its column holds anything truthy.
+    """
+    types = choices(ProjectDescription)
+    checked = np.zeros((len(chunk), len(types)), dtype=bool)
+    for (t, col) in enumerate(types):
+        if col in chunk:
+            values = chunk[col]
+            checked[:, t] = (values.notna() & values.astype(bool)).to_numpy()
+    rows, cols = np.nonzero(checked)
+    return list(zip(
+        np.asarray(record_ids)[rows].tolist(),
+        np.asarray(types)[cols].tolist()))
+
+
+def hash_column(col):
+    """A column as the strings reference.hash_value would make of it."""
+    values = col.to_numpy()
+    text = np.full(len(values), '', dtype=object)
+    present = col.notna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(col):
+        text[present] = col[present].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    elif pd.api.types.is_float_dtype(col):
+        integral = present & (np.mod(values, 1, where=present) == 0)
+        text[integral] = values[integral].astype(np.int64).astype(str)
+        rest = present & ~integral
+        text[rest] = [str(v) for v in values[rest].tolist()]
+    else:
+        text[present] = [str(v) for v in values[present].tolist()]
+    return text
+
+
+def row_hashes(chunk):
+    """Record.source_hash for every row of a chunk (see ppts.reference.row_hash)."""
+    if not len(chunk):
+        return []
+    text = np.column_stack([hash_column(chunk[name]) for name in chunk.columns])
+    return [hashlib.md5('\x1f'.join(line).encode('utf-8')).hexdigest()
+            for line in text.tolist()]
+
+
+def parse_dates(chunk):
+    """Converts the date columns in place.
+
+    Same as read_csv's parse_dates: a column with a value that isn't a date
+    is left as strings.
+    """
+    for col in DATE_COLUMNS:
+        if col in chunk:
+            chunk[col] = pd.to_datetime(
+                chunk[col], errors='ignore', infer_datetime_format=True)
+
+
+def geometry_key(geom):
+    """A 16-byte digest identifying a polygon, for deduplicating Locations.
+
+    Whitespace is normalized first, so the same polygon formatted slightly
+    differently gets the same key.
+    """
+    if pd.isnull(geom):
+        geom = ''
+    normalized = ' '.join(str(geom).split())
+    return hashlib.blake2b(
+        normalized.encode('utf-8'), digest_size=16).digest()
+
+
+# a ring of a WKT polygon, and the brackets opening it: "((" starts a
+# polygon's outer ring, "(" one of its holes
+WKT_RING = re.compile(r'(\(+)([^()]*)\)')
+
+
+def geometry_bounds(geom):
+    """The bounding box and centroid of a WKT (multi)polygon.
+
+    Returns (min_lon, min_lat, max_lon, max_lat, centroid_lon,
+    centroid_lat), all None if geom has no coordinates. The centroid is
+    area weighted, holes taken out; for a polygon with no area it's the
+    middle of the bounding box. Coordinates are taken as planar, which is
+    close enough for a parcel.
+    """
+    if pd.isnull(geom):
+        return (None,) * 6
+    lons = []
+    lats = []
+    area = centroid_lon = centroid_lat = 0.0
+    for match in WKT_RING.finditer(str(geom)):
+        values = list(map(float, match.group(2).replace(',', ' ').split()))
+        x = values[0::2]
+        y = values[1::2]
+        if not x:
+            continue
+        lons.extend((min(x), max(x)))
+        lats.extend((min(y), max(y)))
+        # shoelace formula
+        twice_area = sum_x = sum_y = 0.0
+        x0, y0 = x[-1], y[-1]
+        for (x1, y1) in zip(x, y):
+            cross = x0 * y1 - x1 * y0
+            twice_area += cross
+            sum_x += (x0 + x1) * cross
+            sum_y += (y0 + y1) * cross
+            x0, y0 = x1, y1
+        if not twice_area:
+            continue
+        weight = abs(twice_area)
+        if len(match.group(1)) == 1:
+            weight = -weight
+        centroid_lon += weight * sum_x / (3 * twice_area)
+        centroid_lat += weight * sum_y / (3 * twice_area)
+        area += weight
+    if not lons:
+        return (None,) * 6
+    bounds = (min(lons), min(lats), max(lons), max(lats))
+    if area:
+        return bounds + (centroid_lon / area, centroid_lat / area)
+    return bounds + ((bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2)
+
+
+class ParsedChunk():
+    """The output of parse_chunk.
+
+    rows holds the columns still needed row by row (ROW_COLUMNS), hashes the
+    source_hash of each row and geometry_keys the geometry_key of its
+    the_geom. The child table rows are keyed by the row's position in the
+    chunk rather than a Record primary key; use assign() to swap in the
+    keys. stats times each step, see ppts.instrument.
+    """
+    def __init__(self, rows, hashes, geometry_keys, project_descriptions,
+                 dwelling_types, project_features, land_uses, stats=None):
+        self.rows = rows
+        self.hashes = hashes
+        self.geometry_keys = geometry_keys
+        self.project_descriptions = project_descriptions
+        self.dwelling_types = dwelling_types
+        self.project_features = project_features
+        self.land_uses = land_uses
+        self.stats = stats
+
+
+def parse_chunk(chunk):
+    """Does the part of the import that doesn't depend on other chunks."""
+    stats = Stats()
+    with stats.stage('parse dates'):
+        parse_dates(chunk)
+    with stats.stage('hash rows'):
+        hashes = row_hashes(chunk)
+    # what loadppts dedups Locations by
+    with stats.stage('geometry keys'):
+        geometry_keys = [geometry_key(geom) for geom in chunk.the_geom]
+    positions = np.arange(len(chunk))
+    children = {}
+    for (name, function) in (('project descriptions', project_descriptions),
+                             ('dwelling types', dwelling_types),
+                             ('project features', project_features),
+                             ('land uses', land_uses)):
+        with stats.stage(name):
+            children[name] = function(chunk, positions)
+    return ParsedChunk(
+        rows=chunk[ROW_COLUMNS],
+        hashes=hashes,
+        geometry_keys=geometry_keys,
+        project_descriptions=children['project descriptions'],
+        dwelling_types=children['dwelling types'],
+        project_features=children['project features'],
+        land_uses=children['land uses'],
+        stats=stats)
+
+
+def assign(rows, pks):
+    """Replaces the chunk positions that rows start with by pks[position].
+
+    Rows whose pk is None are dropped.
+    """
+    return [(pks[row[0]],) + row[1:] for row in rows
+            if pks[row[0]] is not None]
@@ -1,8 +1,14 @@
 from django.urls import path
 
+from ppts import api
+from ppts import exports
 from ppts import views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('graphs/<graphname>', views.graphs_manager, name='graph'),
+    path('api/records', api.records, name='api-records'),
+    path('api/records/<int:pk>', api.record, name='api-record'),
+    path('api/search', api.search, name='api-search'),
+    path('export/records.<format>', exports.records, name='export-records'),
 ]
@@ -0,0 +1,202 @@
+"""Backends loadppts uses to write rows to the database.
+
+Rows are tuples of field values, in the order of the field names they are
+passed with (see the *_FIELDS constants in ppts.transform). Every writer
+prepares values with the field's get_db_prep_save, the same as the ORM, so
+they all store the same thing. Rows that already hold values the database
+driver takes as they are (say, read back from a snapshot) can be passed
+with prepared=True to skip that step.
+
+    writer = get_writer(connection)
+    writer.write(LandUse, LAND_USE_FIELDS, rows)
+
+get_writer picks the fastest backend the database supports:
+
+  - PostgreSQL: CopyWriter streams rows with COPY FROM STDIN.
+  - SQLite: InsertWriter uses a single executemany INSERT.
+  - Anything else: BulkCreateWriter goes through Model.objects.bulk_create.
+
+WriteQueue runs the writes in a background thread, so the caller can get on
+with preparing the next rows meanwhile.
+"""
+import csv
+import io
+import queue
+import threading
+
+from django.db import connections
+from django.db import transaction
+
+
+class Writer():
+    name = None
+
+    def __init__(self, connection, batch_size=None):
+        self.connection = connection
+        # rows per statement, None for all of them at once
+        self.batch_size = batch_size
+
+    def columns(self, model, fields):
+        return [model._meta.get_field(name).column for name in fields]
+
+    def prepare(self, model, fields, rows):
+        """Converts rows of Python values to values for the database."""
+        preps = [model._meta.get_field(name).get_db_prep_save
+                 for name in fields]
+        connection = self.connection
+        return [tuple(prep(value, connection)
+                      for (prep, value) in zip(preps, row))
+                for row in rows]
+
+    def write(self, model, fields, rows, prepared=False):
+        raise NotImplementedError
+
+
+class BulkCreateWriter(Writer):
+    """Writes through the ORM. Slowest, but works on any database."""
+    name = 'orm'
+
+    def write(self, model, fields, rows, prepared=False):
+        model.objects.bulk_create(
+            [model(**dict(zip(fields, values))) for values in rows],
+            batch_size=self.batch_size)
+
+
+class InsertWriter(Writer):
+    """Writes with one parameterized INSERT run through executemany."""
+    name = 'insert'
+
+    def write(self, model, fields, rows, prepared=False):
+        if not rows:
+            return
+        if not prepared:
+            rows = self.prepare(model, fields, rows)
+        qn = self.connection.ops.quote_name
+        sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(model._meta.db_table),
+            ', '.join(qn(col) for col in self.columns(model, fields)),
+            ', '.join(['%s'] * len(fields)))
+        # In autocommit mode SQLite would commit (and sync to disk) after
+        # every row
+        size = self.batch_size or len(rows)
+        with transaction.atomic(using=self.connection.alias), \
+                self.connection.cursor() as cursor:
+            for start in range(0, len(rows), size):
+                cursor.executemany(sql, rows[start:start + size])
+
+
+class CopyWriter(Writer):
+    """Streams rows into PostgreSQL with COPY ... FROM STDIN.
+
+    Rows are formatted as CSV in memory, so nothing touches the disk, and
+    the server parses them in one pass rather than one INSERT per batch.
+    That makes batch_size moot, all the rows go in one COPY.
+    """
+    name = 'copy'
+    NULL = '\\N'
+
+    def buffer(self, model, fields, rows, prepared=False):
+        """The rows as a CSV file object, in the format COPY expects."""
+        buf = io.StringIO()
+        out = csv.writer(buf, lineterminator='\n')
+        null = self.NULL
+        if not prepared:
+            rows = self.prepare(model, fields, rows)
+        for row in rows:
+            out.writerow([null if value is None else value for value in row])
+        buf.seek(0)
+        return buf
+
+    def write(self, model, fields, rows, prepared=False):
+        if not rows:
+            return
+        qn = self.connection.ops.quote_name
+        sql = "COPY %s (%s) FROM STDIN WITH (FORMAT csv, NULL '%s')" % (
+            qn(model._meta.db_table),
+            ', '.join(qn(col) for col in self.columns(model, fields)),
+            self.NULL)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                sql, self.buffer(model, fields, rows, prepared))
+
+
+WRITERS = {
+    writer.name: writer
+    for writer in (BulkCreateWriter, InsertWriter, CopyWriter)
+}
+
+VENDOR_WRITERS = {
+    'postgresql': CopyWriter,
+    'sqlite': InsertWriter,
+}
+
+
+def get_writer(connection, name=None, batch_size=None):
+    """The writer called name, or the best one for the connection."""
+    if name:
+        writer = WRITERS[name]
+    else:
+        writer = VENDOR_WRITERS.get(connection.vendor, BulkCreateWriter)
+    return writer(connection, batch_size)
+
+
+class WriteQueue():
+    """Calls write(item) for every item put, in a background thread.
+
+        with WriteQueue(flush, connection) as pending:
+            for batch in batches:
+                pending.put(batch)
+
+    put() blocks while size items are waiting, so the caller doesn't get
+    further ahead than that. The thread starts with the first put(). It
+    borrows the caller's connection (as Django's LiveServerThread does),
+    which keeps everything in the caller's transaction, so the caller
+    mustn't use the database until the with block ends. Leaving it waits
+    for the writes to finish and raises the first exception a write
+    raised, if any; put() raises it too, so the caller stops early.
+    """
+
+    def __init__(self, write, connection, size=1):
+        self.write = write
+        # the connection itself, not django.db.connection, which looks it
+        # up for the current thread
+        self.connection = connections[connection.alias]
+        self.queue = queue.Queue(size)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self.connection.inc_thread_sharing()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.thread.ident is not None:
+            self.queue.put(None)
+            self.thread.join()
+        self.connection.dec_thread_sharing()
+        if exc_type is None:
+            self.check()
+
+    def run(self):
+        connections[self.connection.alias] = self.connection
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            # after a failure, items are only taken off the queue so put()
+            # doesn't block
+            if self.error is None:
+                try:
+                    self.write(item)
+                except BaseException as e:
+                    self.error = e
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def put(self, item):
+        self.check()
+        if self.thread.ident is None:
+            self.thread.start()
+        self.queue.put(item)